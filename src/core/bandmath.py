@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import ast
+import operator
+
+import numpy as np
+
+# band order of input images
+BANDS = {"B": 0, "G": 1, "R": 2, "NIR": 3, "SWIR": 4}
+
+UFUNCS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.true_divide,
+}
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+class LittoDynExpression(object):
+    """
+    Band math expression over named bands, such as (NIR-R)/(NIR+R)
+
+    The expression is compiled once into a list of ufunc calls writing in
+    registers: the output itself, and as few scratch buffers as the
+    expression needs (Sethi-Ullman numbering). It is then evaluated by chunks
+    of pixels, so that scratch buffers stay small and no scene sized
+    temporary is allocated. Operations are the ones numpy would do on whole
+    arrays, in the same order, so results are identical.
+    """
+
+    chunk = 1 << 16
+
+    def __init__(self, expression, bands=None):
+        self.expression = expression
+        self.bands = bands or BANDS
+        self.used = set()
+        self.program = []
+        self.scratch = 0
+
+        try:
+            tree = ast.parse(expression, mode="eval").body
+        except SyntaxError as e:
+            raise ValueError("Invalid expression '{}': {}".format(expression, e))
+
+        node = self._parse(tree)
+        if node[0] != "op":
+            self.program.append((np.copyto, 0, node, None))
+        else:
+            self._compile(node, 0, [])
+
+    def _parse(self, node):
+        """
+        Tree of ("band", index), ("const", value) and ("op", ufunc, a, b),
+        with constant subexpressions folded as python would evaluate them
+        """
+        if isinstance(node, ast.Name):
+            if node.id not in self.bands:
+                raise ValueError(
+                    "Unknown band '{}' in '{}'".format(node.id, self.expression)
+                )
+            self.used.add(self.bands[node.id])
+            return ("band", self.bands[node.id])
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return ("const", node.value)
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._parse(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            if operand[0] == "const":
+                return ("const", -operand[1])
+            return ("op", np.negative, operand, None)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in UFUNCS:
+            a = self._parse(node.left)
+            b = self._parse(node.right)
+            if a[0] == b[0] == "const":
+                try:
+                    return ("const", OPERATORS[type(node.op)](a[1], b[1]))
+                except ZeroDivisionError:
+                    raise ValueError("Division by zero in '{}'".format(self.expression))
+            return ("op", UFUNCS[type(node.op)], a, b)
+
+        raise ValueError(
+            "Unsupported syntax '{}' in '{}'".format(ast.dump(node), self.expression)
+        )
+
+    @staticmethod
+    def _need(node):
+        """
+        Number of registers needed to evaluate a node
+        """
+        if node is None or node[0] != "op":
+            return 0
+        a = LittoDynExpression._need(node[2])
+        b = LittoDynExpression._need(node[3])
+        if a == b:
+            return max(a, 1) if b == 0 else a + 1
+        return max(a, b, 1)
+
+    def _compile(self, node, dst, free):
+        """
+        Instructions evaluating an operation node in register dst, using
+        registers of free as scratch
+        """
+        ufunc, a, b = node[1:]
+        need_a, need_b = self._need(a), self._need(b)
+
+        if need_a and need_b:
+            # the most demanding operand is evaluated first, in dst
+            reg = free[0] if free else self._new_register()
+            rest = free[1:]
+            if need_a >= need_b:
+                self._compile(a, dst, [reg] + rest)
+                self._compile(b, reg, rest)
+                a, b = ("reg", dst), ("reg", reg)
+            else:
+                self._compile(b, dst, [reg] + rest)
+                self._compile(a, reg, rest)
+                a, b = ("reg", reg), ("reg", dst)
+        elif need_a:
+            self._compile(a, dst, free)
+            a = ("reg", dst)
+        elif need_b:
+            self._compile(b, dst, free)
+            b = ("reg", dst)
+
+        self.program.append((ufunc, dst, a, b))
+
+    def _new_register(self):
+        self.scratch += 1
+        return self.scratch
+
+    def evaluate(self, img, out=None):
+        """
+        Evaluate expression on an image of shape (bands, ...), in out if given
+        """
+        if self.used and max(self.used) >= img.shape[0]:
+            names = [n for n, i in self.bands.items() if i >= img.shape[0]]
+            raise ValueError(
+                "'{}' needs bands missing in image: {}".format(
+                    self.expression, ", ".join(names)
+                )
+            )
+
+        dtype = np.result_type(img.dtype, np.float32)
+        if out is None:
+            out = np.empty(img.shape[1:], dtype=dtype)
+
+        pixels = img.reshape(img.shape[0], -1)
+        flat = out.reshape(-1)
+        scratch = [np.empty(self.chunk, dtype=dtype) for _ in range(self.scratch)]
+
+        for start in range(0, flat.size, self.chunk):
+            stop = min(start + self.chunk, flat.size)
+            registers = [flat[start:stop]]
+            registers += [s[: stop - start] for s in scratch]
+
+            def operand(o):
+                if o[0] == "band":
+                    return pixels[o[1], start:stop]
+                if o[0] == "reg":
+                    return registers[o[1]]
+                return o[1]
+
+            for ufunc, dst, a, b in self.program:
+                if ufunc is np.copyto:
+                    np.copyto(registers[dst], operand(a))
+                elif b is None:
+                    ufunc(operand(a), out=registers[dst])
+                else:
+                    ufunc(operand(a), operand(b), out=registers[dst])
+
+        if not np.shares_memory(flat, out):
+            out[...] = flat.reshape(out.shape)
+        return out
+
+
+indices = {}
+
+
+def register(name, expression, bands=None):
+    """
+    Register a spectral index, usable by change detectors
+    """
+    indices[name.upper()] = LittoDynExpression(expression, bands)
+    return indices[name.upper()]
+
+
+def index(name):
+    try:
+        return indices[name.upper()]
+    except KeyError:
+        raise ValueError("Unknown index '{}'".format(name))
+
+
+# https://www.indexdatabase.de/db/i-single.php?id=58
+register("NDVI", "(NIR-R)/(NIR+R)")
+# https://www.indexdatabase.de/db/i-single.php?id=16
+register("EVI", "2.5*((NIR-R)/(NIR+6*R-7.5*B+1))")
+# https://www.indexdatabase.de/db/i-single.php?id=390
+register("NGRDI", "(G-R)/(G+R)")
+# soil adjusted vegetation index, with L=0.5
+register("SAVI", "1.5*(NIR-R)/(NIR+R+0.5)")
+# normalized difference water index (McFeeters)
+register("NDWI", "(G-NIR)/(G+NIR)")
+# modified normalized difference water index, needs a short wave infrared band
+register("MNDWI", "(G-SWIR)/(G+SWIR)")
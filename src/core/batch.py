@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+# Headless batch change detection, without QGIS
+#
+# Jobs are read from a JSON or CSV manifest, one job per pair of images:
+#
+#   id,image1,image2,roi,algorithms,output
+#   site1,a.tif,b.tif,roi.shp,NDVI;EUCL,site1.tif
+#
+# Relative paths are relative to the manifest. Jobs run in a pool of
+# processes, and their status (timing, error) is journaled next to the
+# manifest after each job, so that an interrupted batch is resumed by running
+# the same command again: jobs whose output is complete, and was made with the
+# same options, are skipped.
+#
+#   $ PYTHONPATH=$(pwd) python -m src.core.batch jobs.csv --jobs 4
+#
+# With --mask, a 1 bit mask of changes above threshold (Otsu by default) is
+# saved next to each output, as <output>_mask.tif.
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from osgeo import gdal
+
+from . import registry
+from .changedetector.multi import LittoDynChangeDetectorMulti
+
+# detectors are only imported by the jobs using them
+ALGOS = registry.detectors
+
+FIELDS = ["id", "image1", "image2", "roi", "algorithms", "output"]
+
+
+class LittoDynBatchError(Exception):
+    pass
+
+
+def read_manifest(path):
+    """
+    Jobs of a JSON (list of objects) or CSV manifest, with absolute paths
+    """
+    with open(path) as f:
+        if path.lower().endswith(".json"):
+            jobs = json.load(f)
+        else:
+            jobs = list(csv.DictReader(f))
+
+    root = os.path.dirname(os.path.abspath(path))
+    ids = set()
+    for i, job in enumerate(jobs):
+        missing = [k for k in FIELDS[1:] if not job.get(k)]
+        if missing:
+            raise LittoDynBatchError(
+                "Job {}: missing {}".format(i + 1, ", ".join(missing))
+            )
+
+        job["id"] = str(job.get("id") or i + 1)
+        if job["id"] in ids:
+            raise LittoDynBatchError("Job {}: duplicated id".format(job["id"]))
+        ids.add(job["id"])
+
+        algos = job["algorithms"]
+        if isinstance(algos, str):
+            algos = [a.strip() for a in algos.replace(",", ";").split(";")]
+        job["algorithms"] = [a.upper() for a in algos if a]
+        unknown = [a for a in job["algorithms"] if a not in ALGOS]
+        if unknown:
+            raise LittoDynBatchError(
+                "Job {}: unknown algorithms {}".format(job["id"], ", ".join(unknown))
+            )
+
+        for key in ("image1", "image2", "roi", "output"):
+            job[key] = os.path.join(root, os.path.expanduser(job[key]))
+
+    return jobs
+
+
+def read_journal(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_journal(path, journal):
+    """
+    Journal is replaced atomically, so that it is never left half written
+    """
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        json.dump(journal, f, indent=2)
+    os.replace(tmp, path)
+
+
+def mask_path(job):
+    return "{}_mask.tif".format(os.path.splitext(job["output"])[0])
+
+
+def effective_options(options):
+    """
+    Options which outputs depend on, as journaled: the number of workers
+    only changes how fast they are made
+    """
+    options = dict(options, detector=dict(options["detector"]))
+    options["detector"].pop("workers", None)
+    # as read back from the journal
+    return json.loads(json.dumps(options))
+
+
+def is_complete(job, status, options):
+    """
+    Output is complete when it has been journaled as done with the same
+    options, is unchanged since and is a readable raster with one band per
+    algorithm
+    """
+    if not status or status.get("status") != "done":
+        return False
+    if status.get("options") != effective_options(options):
+        return False
+    if options.get("mask") and not os.path.exists(mask_path(job)):
+        return False
+
+    path = job["output"]
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != status.get("size") or stat.st_mtime != status.get("mtime"):
+        return False
+
+    ds = gdal.Open(path)
+    return ds is not None and ds.RasterCount == len(job["algorithms"])
+
+
+def run(job, options):
+    """
+    Run a job, in a process of the pool. Output is written in a temporary
+    file which is renamed when complete, so that a crash never leaves a
+    partial output.
+    """
+    start = time.time()
+    status = {"started": start, "options": effective_options(options)}
+    tmp = "{}.part".format(job["output"])
+    tmp_mask = "{}.part".format(mask_path(job))
+
+    try:
+        classes = [ALGOS[a].load() for a in job["algorithms"]]
+        paths = (job["image1"], job["image2"], job["roi"])
+        if len(classes) == 1:
+            detector = classes[0](*paths, **options["detector"])
+        else:
+            detector = LittoDynChangeDetectorMulti(
+                *paths,
+                classes,
+                [a.lower() for a in job["algorithms"]],
+                **options["detector"]
+            )
+        detector.detect()
+
+        os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        save = dict(options["save"])
+        if options.get("mask"):
+            save.update(options["mask"], path_mask=tmp_mask)
+        detector.save(tmp, **save)
+
+        # output is renamed last, as it marks the job as complete
+        if options.get("mask"):
+            os.replace(tmp_mask, mask_path(job))
+            status["thresholds"] = detector.thresholds
+        os.replace(tmp, job["output"])
+
+        stat = os.stat(job["output"])
+        status.update(status="done", size=stat.st_size, mtime=stat.st_mtime)
+    except Exception as e:
+        for path in (tmp, tmp_mask):
+            if os.path.exists(path):
+                os.remove(path)
+        status.update(status="failed", error=str(e), traceback=traceback.format_exc())
+
+    status["elapsed"] = time.time() - start
+    return job["id"], status
+
+
+def process(jobs, journal, path_journal, options, processes=1, log=sys.stderr):
+    """
+    Run jobs which are not complete yet, journaling their status as soon as
+    they are done. Returns the number of failed jobs.
+    """
+    todo = []
+    for job in jobs:
+        if is_complete(job, journal.get(job["id"]), options):
+            print("{}: skipped, output complete".format(job["id"]), file=log)
+        else:
+            todo.append(job)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(run, job, options) for job in todo]
+        for future in as_completed(futures):
+            job_id, status = future.result()
+            journal[job_id] = status
+            write_journal(path_journal, journal)
+
+            if status["status"] == "failed":
+                failed += 1
+                print("{}: failed, {}".format(job_id, status["error"]), file=log)
+            else:
+                print("{}: done in {:.2f}s".format(job_id, status["elapsed"]), file=log)
+
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch change detection")
+    parser.add_argument("manifest", help="JSON or CSV manifest of jobs")
+    parser.add_argument("--jobs", type=int, default=1, help="parallel jobs")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes per job, by windows"
+    )
+    parser.add_argument("--journal", default=None, help="status of jobs")
+    parser.add_argument("--full-extent", action="store_true")
+    parser.add_argument("--cog", action="store_true")
+    parser.add_argument("--encoding", choices=["int16", "float16"], default=None)
+    parser.add_argument("--force", action="store_true", help="rerun complete jobs")
+    parser.add_argument("--mask", action="store_true", help="save 1 bit masks")
+    parser.add_argument(
+        "--threshold",
+        default="otsu",
+        help="otsu, percentile or a value of change, for masks",
+    )
+    parser.add_argument("--percentile", type=float, default=90)
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = read_manifest(args.manifest)
+    except (OSError, ValueError, LittoDynBatchError) as e:
+        parser.error(str(e))
+
+    path_journal = args.journal or "{}.status.json".format(args.manifest)
+    journal = {} if args.force else read_journal(path_journal)
+
+    options = {
+        "detector": {
+            "windowed": True,
+            "roi_only": True,
+            "sparse": True,
+            "full_extent": args.full_extent,
+            "workers": args.workers,
+            # each image is read once per job
+            "cache": False,
+        },
+        "save": {"cog": args.cog, "encoding": args.encoding},
+    }
+    if args.mask:
+        threshold = args.threshold
+        if threshold not in ("otsu", "percentile"):
+            try:
+                threshold = float(threshold)
+            except ValueError:
+                parser.error("invalid threshold: {}".format(threshold))
+        options["mask"] = {"threshold": threshold, "percentile": args.percentile}
+
+    failed = process(jobs, journal, path_journal, options, processes=args.jobs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
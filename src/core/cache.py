@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LittoDynRasterCache(object):
+    """
+    LRU cache of arrays (decoded raster windows, roi masks...), shared by all
+    detectors of the process. Raster windows are keyed by path, file
+    modification time and size, bands, window, type and scale, so that a
+    modified file is read again. Cached arrays are read-only.
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, path, bands, window, dtype, scale=1):
+        """
+        Key of a window of an image, None if the image is not a local file
+        """
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None
+
+        return (
+            os.path.realpath(path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            bands,
+            tuple(window),
+            np.dtype(dtype).str,
+            scale,
+        )
+
+    def get(self, key):
+        with self.lock:
+            img = self.entries.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return img
+
+    def put(self, key, img):
+        if img.nbytes > self.max_bytes:
+            return
+
+        img.setflags(write=False)
+        with self.lock:
+            if key in self.entries:
+                return
+
+            self.entries[key] = img
+            self.nbytes += img.nbytes
+            self._evict()
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self.entries:
+            _, img = self.entries.popitem(last=False)
+            self.nbytes -= img.nbytes
+
+
+raster_cache = LittoDynRasterCache()
+
+# bit-packed roi masks
+mask_cache = LittoDynRasterCache(max_bytes=1 << 26)
+
+# per date indexes of time series
+index_cache = LittoDynRasterCache(max_bytes=1 << 28)
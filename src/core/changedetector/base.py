@@ -7,8 +7,64 @@ __date__ = "2020/10/10"
 __email__ = "blottiere.paul@gmail.com"
 __license__ = "GPLv3"
 
+import os
+import sys
+import copy
+import time
+import hashlib
+import shutil
+import tempfile
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from osgeo import gdal, ogr
+from osgeo import gdal, ogr, osr
+
+from ..cache import mask_cache, raster_cache
+from ..observer import LittoDynCancelled
+from ..pipeline import LittoDynAsyncWriter, LittoDynPrefetchReader
+from ..threshold import LittoDynHistogram
+from ..writer import LittoDynRasterWriter
+from ..zonal import LittoDynZonalStats
+
+
+def _detect_window(detector, window):
+    """
+    Entry point of pool workers: each worker opens the datasets by itself
+    """
+    # windows are never read twice by a worker
+    detector.cache = False
+    try:
+        return window, detector._detect_window(window)
+    finally:
+        detector._release()
+
+
+def _pool_context():
+    """
+    Spawn context of pool workers, None when no python interpreter is found
+
+    Workers are spawned rather than forked, as forking an application with
+    threads (QGIS) is unsafe. When python is embedded, sys.executable is the
+    application itself, and workers are run by the interpreter installed
+    with it instead.
+    """
+    executable = sys.executable
+    if not os.path.basename(executable).lower().startswith("python"):
+        candidates = [
+            os.path.join(sys.exec_prefix, "python.exe"),
+            os.path.join(sys.exec_prefix, "bin", "python3"),
+            os.path.join(sys.exec_prefix, "bin", "python"),
+        ]
+        executable = next((c for c in candidates if os.path.isfile(c)), None)
+        if executable is None:
+            return None
+
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(executable)
+    return context
 
 
 class LittoDynChangeDetector(object):
@@ -17,62 +73,1120 @@ class LittoDynChangeDetector(object):
     Implement common methods (read, write, ROI...) to all detectors
     """
 
-    def __init__(self, path_img1, path_img2, path_roi):
+    # the change of a pixel only depends on the pixel itself, so detection
+    # may be run window by window
+    tileable = True
+
+    # minimum number of pixels read at once when the image is striped
+    window_pixels = 1 << 20
+
+    # roi envelopes closer than this number of pixels are read as one window
+    roi_merge_distance = 64
+
+    # resampling of images which are not on the grid of image 1
+    resampling = "bilinear"
+
+    def __init__(
+        self,
+        path_img1,
+        path_img2,
+        path_roi,
+        windowed=False,
+        roi_only=False,
+        full_extent=False,
+        workers=1,
+        dtype=np.float32,
+        cache=False,
+        roi_srs=None,
+        scale=1,
+        build_overviews=False,
+        observer=None,
+        cancel=None,
+        prefetch=2,
+        sparse=False,
+        statistics=False,
+        change_threshold=None,
+    ):
+        """
+        path_roi is the path of a vector file, an OGR layer or a list of WKB
+        geometries (in roi_srs).
+
+        windowed: inputs are not loaded here, but read window by window
+        (following the natural block size of image 1) while save() streams
+        each window of changes into the output, so that memory is bounded
+        whatever the size of the scene.
+
+        roi_only: only the pixel envelopes of roi features are read and
+        processed, and the output is cropped to the roi extent unless
+        full_extent is set.
+
+        workers, prefetch: windows are computed by a pool of worker
+        processes, or read and written by background threads up to prefetch
+        windows ahead (see _detect_windows()).
+
+        dtype: type of images (bands, rows, cols) arrays, of changes and of the
+        output file (float32 by default, float64 on demand).
+
+        cache: decoded blocks are kept in the raster cache of the process (see
+        _read()).
+
+        scale: detection is run on a preview grid scale times coarser than
+        images (see _init_preview()).
+
+        observer, cancel: a LittoDynObserver notified of stages and progress,
+        and a LittoDynCancelToken checked between stages and windows
+        (LittoDynCancelled is raised when it is cancelled).
+
+        sparse: detection is run on roi pixels only (see _dodetect_sparse()).
+
+        statistics: statistics of changes of roi features are accumulated
+        while changes are computed (see statistics()).
+        """
         self.path_img1 = path_img1
         self.path_img2 = path_img2
         self.path_roi = path_roi
-        self._load_inputs()
+        self.roi_srs = roi_srs
+        self.scale = max(1, int(scale))
+        self.build_overviews = build_overviews
+        self.roi_key = None
+        if isinstance(path_roi, ogr.Layer):
+            # keep geometries only, so that detectors can be pickled
+            self.path_roi = []
+            for feature in path_roi:
+                geom = feature.GetGeometryRef()
+                if geom is not None:
+                    self.path_roi.append(bytes(geom.ExportToWkb()))
+            srs = path_roi.GetSpatialRef()
+            if srs is not None:
+                self.roi_srs = srs.ExportToWkt()
+        self.workers = workers
+        self.windowed = (windowed or workers > 1) and self.tileable
+        self.roi_only = roi_only
+        self.full_extent = full_extent
+        self.dtype = np.dtype(dtype)
+        self.cache = cache
+        self.shared = {}
+        self.window = None
+        self.observer = observer
+        self.cancel = cancel
+        self.prefetch = prefetch
+        self.sparse = sparse and self.tileable
+        self.inside = None
+        self.statistics_enabled = statistics
+        self.change_threshold = change_threshold
+        self.zonal = None
+        self.bytes_read = 0
+        self.datasets = {}
 
-    def _load_inputs(self):
+        if self.windowed:
+            self._load_metadata()
+        else:
+            self._load_inputs()
+            self._release()
+
+    def __getstate__(self):
+        # copies run by threads and pool workers open datasets by themselves
+        state = dict(self.__dict__)
+        state["datasets"] = {}
+        return state
+
+    def _load_metadata(self):
         ds = gdal.Open(self.path_img1, gdal.GA_ReadOnly)
         self.geo = ds.GetGeoTransform()
         self.proj = ds.GetProjection()
         self.cols = ds.RasterXSize
         self.rows = ds.RasterYSize
         self.bands = ds.RasterCount
-        self.img1 = np.zeros([self.rows, self.cols, self.bands], dtype=np.float)
-        for i in range(self.bands):
-            self.img1[:, :, i] = ds.GetRasterBand(i + 1).ReadAsArray()
-        self.img2 = np.zeros([self.rows, self.cols, self.bands], dtype=np.float)
-        ds = gdal.Open(self.path_img2, gdal.GA_ReadOnly)
+        self.block = ds.GetRasterBand(1).GetBlockSize()
+
+        # full resolution grid of images
+        self.src_geo = self.geo
+        self.src_cols = self.cols
+        self.src_rows = self.rows
+        self.path_img2 = self._coregister(self.path_img2)
+        if self.scale > 1:
+            self._init_preview()
+
+        self.roi_windows = [(0, 0, self.cols, self.rows)]
+        if self.roi_only:
+            self.roi_windows = self._roi_windows()
+        self.extent = self._envelope(self.roi_windows)
+
+    def _coregister(self, path):
+        """
+        Path of an image on the grid of image 1: the image itself if grids
+        match, a warped VRT otherwise (size, geotransform or spatial reference
+        differ), so that only the windows which are read are resampled
+        """
+        ds = gdal.Open(path, gdal.GA_ReadOnly)
+        if ds.RasterCount != self.bands:
+            raise ValueError(
+                "{} has {} bands, {} expected".format(path, ds.RasterCount, self.bands)
+            )
+
+        geo = ds.GetGeoTransform()
+        same_grid = (ds.RasterXSize, ds.RasterYSize) == (self.src_cols, self.src_rows)
+        # same origin and pixel size, up to a thousandth of pixel
+        tolerance = 1e-3 * min(abs(self.src_geo[1]), abs(self.src_geo[5]))
+        same_grid &= np.allclose(geo, self.src_geo, rtol=0, atol=tolerance)
+        if same_grid and ds.GetProjection() != self.proj:
+            srs1, srs2 = osr.SpatialReference(), osr.SpatialReference()
+            srs1.ImportFromWkt(self.proj)
+            srs2.ImportFromWkt(ds.GetProjection())
+            same_grid = bool(srs1.IsSame(srs2))
+        if same_grid:
+            return path
+
+        if self.src_geo[2] or self.src_geo[4]:
+            raise ValueError("Rotated grids are not supported for co-registration")
+
+        # VRT files are named after the image and target grid, so that they
+        # are reused between runs and shared by pool workers
+        source = (path,)
+        if os.path.exists(path):
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            source = (path, stat.st_mtime, stat.st_size)
+        digest = hashlib.sha1()
+        for item in source + (self.proj, self.src_geo):
+            digest.update(repr(item).encode())
+        digest.update(repr((self.src_cols, self.src_rows, self.resampling)).encode())
+        vrt = os.path.join(
+            tempfile.gettempdir(), "littodyn_{}.vrt".format(digest.hexdigest())
+        )
+        if os.path.exists(vrt):
+            return vrt
+
+        bounds = (
+            self.src_geo[0],
+            self.src_geo[3] + self.src_rows * self.src_geo[5],
+            self.src_geo[0] + self.src_cols * self.src_geo[1],
+            self.src_geo[3],
+        )
+        tmp = "{}.{}.tmp".format(vrt, os.getpid())
+        gdal.Warp(
+            tmp,
+            path,
+            format="VRT",
+            dstSRS=self.proj or None,
+            outputBounds=bounds,
+            width=self.src_cols,
+            height=self.src_rows,
+            resampleAlg=self.resampling,
+        )
+        os.replace(tmp, vrt)
+        return vrt
+
+    def _init_preview(self):
+        """
+        Switch to a grid scale times coarser than images
+
+        GDAL then reads decimated windows from the best overview level (built
+        on demand with build_overviews), so that a low resolution change
+        raster is produced in a fraction of the time.
+        """
+        s = self.scale
+        geo = list(self.geo)
+        geo[1], geo[2], geo[4], geo[5] = geo[1] * s, geo[2] * s, geo[4] * s, geo[5] * s
+        self.geo = tuple(geo)
+        self.cols = -(-self.src_cols // s)
+        self.rows = -(-self.src_rows // s)
+        self.block = (max(1, self.block[0] // s), max(1, self.block[1] // s))
+
+        if self.build_overviews:
+            for path in (self.path_img1, self.path_img2):
+                self._overviews(path)
+
+    def _overviews(self, path):
+        """
+        Build overviews of an image, up to the preview scale, when missing
+        """
+        ds = gdal.Open(path, gdal.GA_ReadOnly)
+        if ds.GetRasterBand(1).GetOverviewCount() > 0:
+            return
+
+        levels = []
+        level = 2
+        while level <= self.scale:
+            levels.append(level)
+            level *= 2
+
+        if levels:
+            # read-only datasets get external .ovr overviews
+            ds.BuildOverviews("AVERAGE", levels)
+
+    def _load_inputs(self):
+        self._load_metadata()
+        with self._stage("load"):
+            self._load_images()
+        with self._stage("mask"):
+            self._init_mask()
+
+    def _check_cancel(self):
+        if self.cancel is not None and self.cancel.is_cancelled():
+            raise LittoDynCancelled()
+
+    @contextmanager
+    def _stage(self, stage, pixels=0):
+        """
+        Notify the observer of a stage, after checking for cancellation
+        """
+        self._check_cancel()
+        if self.observer is None:
+            yield
+            return
+
+        self.observer.stage_started(stage)
+        bytes_read = self.bytes_read
+        start = time.perf_counter()
+        yield
+        self.observer.stage_finished(
+            stage, time.perf_counter() - start, self.bytes_read - bytes_read, pixels
+        )
+
+    def _progress(self, fraction):
+        if self.observer is not None:
+            self.observer.progress(fraction)
+
+    def _load_images(self, window=None, prefetched=None):
+        """
+        Read both images on a window, or on the whole extent, unless they have
+        been prefetched
+        """
+        self.window = window
+        if prefetched is not None:
+            self.img1, self.img2 = prefetched
+            return
+        self.img1 = self._read_window(self.path_img1, window)
+        self.img2 = self._read_window(self.path_img2, window)
+
+    def _prefetch(self, window):
+        """
+        Inputs of a window read ahead by the prefetch thread, given to
+        _load_images()
+        """
+        return (
+            self._read_window(self.path_img1, window),
+            self._read_window(self.path_img2, window),
+        )
+
+    def _roi_windows(self):
+        """
+        Pixel envelopes of roi features, merged when they overlap or are
+        closer than roi_merge_distance
+        """
+        dataSource, layer = self._roi_layer()
+        transform = self._roi_transform(layer)
+
+        windows = []
+        for feature in layer:
+            geom = feature.GetGeometryRef()
+            if geom is None or geom.IsEmpty():
+                continue
+
+            if transform is not None:
+                # envelope in the spatial reference of images
+                geom = geom.Clone()
+                geom.Transform(transform)
+            minx, maxx, miny, maxy = geom.GetEnvelope()
+            cols = [(x - self.geo[0]) / self.geo[1] for x in (minx, maxx)]
+            rows = [(y - self.geo[3]) / self.geo[5] for y in (miny, maxy)]
+            # one pixel margin for pixels touched by the envelope borders
+            x0 = max(int(np.floor(min(cols))) - 1, 0)
+            y0 = max(int(np.floor(min(rows))) - 1, 0)
+            x1 = min(int(np.ceil(max(cols))) + 1, self.cols)
+            y1 = min(int(np.ceil(max(rows))) + 1, self.rows)
+            if x1 > x0 and y1 > y0:
+                windows.append((x0, y0, x1 - x0, y1 - y0))
+
+        if not windows:
+            # nothing to read, keep a single pixel to get a valid output
+            return [(0, 0, 1, 1)]
+
+        merged = True
+        while merged:
+            merged = False
+            clusters = []
+            for window in windows:
+                for i, cluster in enumerate(clusters):
+                    if self._close(window, cluster):
+                        clusters[i] = self._envelope([window, cluster])
+                        merged = True
+                        break
+                else:
+                    clusters.append(window)
+            windows = clusters
+
+        return sorted(windows, key=lambda w: (w[1], w[0]))
+
+    def _roi_transform(self, layer):
+        """
+        Transformation from the spatial reference of the roi (roi_srs, or the
+        one of the layer) to the one of images, None when they are the same
+        or unknown
+        """
+        source = None
+        if self.roi_srs:
+            source = osr.SpatialReference()
+            source.ImportFromWkt(self.roi_srs)
+        else:
+            source = layer.GetSpatialRef()
+        if source is None or not self.proj:
+            return None
+
+        target = osr.SpatialReference()
+        target.ImportFromWkt(self.proj)
+        if source.IsSame(target):
+            return None
+
+        # x, y order whatever the axis order of the authority (GDAL >= 3)
+        if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+            source = source.Clone()
+            source.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            target.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        return osr.CoordinateTransformation(source, target)
+
+    def _roi_layer(self):
+        """
+        Roi as an OGR layer, returned with its datasource
+        """
+        if isinstance(self.path_roi, str):
+            dataSource = ogr.Open(self.path_roi, 0)
+            return dataSource, dataSource.GetLayer()
+
+        srs = None
+        if self.roi_srs:
+            srs = osr.SpatialReference()
+            srs.ImportFromWkt(self.roi_srs)
+            # WKB geometries are x, y (lon, lat), as OGR drivers give them
+            if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+                srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+        dataSource = ogr.GetDriverByName("Memory").CreateDataSource("")
+        layer = dataSource.CreateLayer("roi", srs, ogr.wkbUnknown)
+        for wkb in self.path_roi:
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(ogr.CreateGeometryFromWkb(bytes(wkb)))
+            layer.CreateFeature(feature)
+        return dataSource, layer
+
+    def _roi_hash(self):
+        """
+        Hash of roi geometries and spatial reference
+        """
+        if self.roi_key is None:
+            digest = hashlib.sha1()
+            dataSource, layer = self._roi_layer()
+            srs = layer.GetSpatialRef()
+            if srs is not None:
+                digest.update(srs.ExportToWkt().encode())
+            for feature in layer:
+                geom = feature.GetGeometryRef()
+                if geom is not None:
+                    digest.update(geom.ExportToWkb())
+            self.roi_key = digest.hexdigest()
+
+        return self.roi_key
+
+    def _close(self, w1, w2):
+        """
+        True if two windows overlap or are closer than roi_merge_distance
+        """
+        d = self.roi_merge_distance
+        return (
+            w1[0] <= w2[0] + w2[2] + d
+            and w2[0] <= w1[0] + w1[2] + d
+            and w1[1] <= w2[1] + w2[3] + d
+            and w2[1] <= w1[1] + w1[3] + d
+        )
+
+    def _envelope(self, windows):
+        """
+        Smallest window containing all windows
+        """
+        x0 = min(w[0] for w in windows)
+        y0 = min(w[1] for w in windows)
+        x1 = max(w[0] + w[2] for w in windows)
+        y1 = max(w[1] + w[3] for w in windows)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def _read_extent(self, path):
+        """
+        Read roi windows of an image in an array covering the whole extent
+        """
+        if self.roi_windows == [self.extent]:
+            return self._read(path, self.extent)
+
+        ex, ey, ew, eh = self.extent
+        img = np.zeros([self.bands, eh, ew], dtype=self.dtype)
+        for window in self.roi_windows:
+            x, y, w, h = window
+            self._read(path, window, img[:, y - ey : y - ey + h, x - ex : x - ex + w])
+        return img
+
+    def _read_window(self, path, window=None):
+        """
+        Read an image on a window, or on the whole extent
+        """
+        if window is None:
+            return self._read_extent(path)
+        return self._read(path, window)
+
+    def _read(self, path, window, out=None):
+        """
+        Read a (xoff, yoff, xsize, ysize) window of all bands of an image,
+        directly decoded by GDAL in a (bands, rows, cols) array
+
+        With cache, decoded blocks are kept in the raster cache and reused by
+        the next detectors run on the same files. It is off by default, as
+        windows streamed once would only fill the cache: the processing
+        algorithms, whose runs are repeated on the same images, turn it on.
+        """
+        key = None
+        if self.cache:
+            key = raster_cache.key(path, self.bands, window, self.dtype, self.scale)
+        if key is None:
+            return self._decode(path, window, out)
+
+        # natural blocks are cached, whatever the roi which windows are
+        # clipped to
+        xoff, yoff, xsize, ysize = window
+        bx, by = self._block_size()
+        for y in range(yoff - yoff % by, yoff + ysize, by):
+            for x in range(xoff - xoff % bx, xoff + xsize, bx):
+                block = (x, y, min(bx, self.cols - x), min(by, self.rows - y))
+                block_key = key[:4] + (block,) + key[5:]
+                img = raster_cache.get(block_key)
+                if img is None:
+                    img = self._decode(path, block)
+                    raster_cache.put(block_key, img)
+                if block == tuple(window) and out is None:
+                    return img
+
+                if out is None:
+                    out = np.empty([self.bands, ysize, xsize], dtype=self.dtype)
+                x0, y0 = max(x, xoff), max(y, yoff)
+                x1 = min(x + block[2], xoff + xsize)
+                y1 = min(y + block[3], yoff + ysize)
+                out[:, y0 - yoff : y1 - yoff, x0 - xoff : x1 - xoff] = img[
+                    :, y0 - y : y1 - y, x0 - x : x1 - x
+                ]
+        return out
+
+    def _decode(self, path, window, out=None):
+        xoff, yoff, xsize, ysize = window
+        if out is None:
+            out = np.empty([self.bands, ysize, xsize], dtype=self.dtype)
+
+        # window of the images for the (preview) grid window
+        s = self.scale
+        src_xoff, src_yoff = xoff * s, yoff * s
+        src_xsize = min(xsize * s, self.src_cols - src_xoff)
+        src_ysize = min(ysize * s, self.src_rows - src_yoff)
+
+        self.bytes_read += out.nbytes
+        ds = self._dataset(path)
         for i in range(self.bands):
-            self.img2[:, :, i] = ds.GetRasterBand(i + 1).ReadAsArray()
-        self._init_mask()
+            ds.GetRasterBand(i + 1).ReadAsArray(
+                src_xoff,
+                src_yoff,
+                src_xsize,
+                src_ysize,
+                buf_xsize=xsize,
+                buf_ysize=ysize,
+                buf_obj=out[i],
+            )
+        return out
+
+    def _dataset(self, path):
+        """
+        Dataset of an image, opened once for all windows
+        """
+        ds = self.datasets.get(path)
+        if ds is None:
+            ds = gdal.Open(path, gdal.GA_ReadOnly)
+            self.datasets[path] = ds
+        return ds
+
+    def _release(self):
+        """
+        Close datasets of images
+        """
+        self.datasets = {}
 
-    def _init_mask(self):
+    def _geo(self, window):
         """
-        Rasterize roi on dataset area
+        Geotransform of a window
         """
-        driver = ogr.GetDriverByName("ESRI Shapefile")
-        dataSource = driver.Open(self.path_roi, 1)
-        layer = dataSource.GetLayer()
+        xoff, yoff = window[0], window[1]
+        geo = list(self.geo)
+        geo[0] = self.geo[0] + xoff * self.geo[1] + yoff * self.geo[2]
+        geo[3] = self.geo[3] + xoff * self.geo[4] + yoff * self.geo[5]
+        return geo
+
+    def _init_mask(self, window=None):
+        """
+        Rasterize roi on dataset extent (or on a window of it)
+
+        Masks are kept bit-packed in the mask cache, keyed by geometries and
+        geotransform.
+        """
+        if window is None:
+            window = self.extent
+        xsize, ysize = window[2], window[3]
+
+        key = None
+        if self.cache:
+            geo = tuple(self._geo(window))
+            key = (self._roi_hash(), geo, xsize, ysize, self.proj)
+            packed = mask_cache.get(key)
+            if packed is not None:
+                self.roi_mask = np.unpackbits(packed, axis=1, count=xsize)
+                return
+
+        self.roi_mask = self._rasterize(window)
+        if key is not None:
+            mask_cache.put(key, np.packbits(self.roi_mask, axis=1))
+
+    def _rasterize(self, window):
+        """
+        Rasterize roi on a window
+        """
+        xsize, ysize = window[2], window[3]
+
+        dataSource, layer = self._roi_layer()
         # Memory dataset for rasterized roi
         target_ds = gdal.GetDriverByName("MEM").Create(
-            "", self.cols, self.rows, 1, gdal.GDT_Byte
+            "", xsize, ysize, 1, gdal.GDT_Byte
         )
-        target_ds.SetGeoTransform(self.geo)
+        target_ds.SetGeoTransform(self._geo(window))
         target_ds.SetProjection(self.proj)
-        datainit = np.zeros([self.rows, self.cols], dtype=np.int8)
+        datainit = np.zeros([ysize, xsize], dtype=np.int8)
         myband = target_ds.GetRasterBand(1)
         myband.WriteArray(datainit)
         gdal.RasterizeLayer(target_ds, (1,), layer, burn_values=(1,))
-        self.roi_mask = target_ds.GetRasterBand(1).ReadAsArray()
+        return target_ds.GetRasterBand(1).ReadAsArray()
+
+    def _labels(self, window, group=None):
+        """
+        Rasterize roi features on a window as labels, 1 for the first feature,
+        only features of group (a set of labels) if given
+        """
+        xsize, ysize = window[2], window[3]
+
+        dataSource, layer = self._roi_layer()
+        memory = ogr.GetDriverByName("Memory").CreateDataSource("")
+        labelled = memory.CreateLayer("labels", layer.GetSpatialRef(), ogr.wkbUnknown)
+        labelled.CreateField(ogr.FieldDefn("label", ogr.OFTInteger))
+        for i, feature in enumerate(layer):
+            geom = feature.GetGeometryRef()
+            if geom is None or (group is not None and i + 1 not in group):
+                continue
+            label = ogr.Feature(labelled.GetLayerDefn())
+            label.SetGeometry(geom.Clone())
+            label.SetField("label", i + 1)
+            labelled.CreateFeature(label)
+
+        target_ds = gdal.GetDriverByName("MEM").Create(
+            "", xsize, ysize, 1, gdal.GDT_UInt32
+        )
+        target_ds.SetGeoTransform(self._geo(window))
+        target_ds.SetProjection(self.proj)
+        gdal.RasterizeLayer(target_ds, (1,), labelled, options=["ATTRIBUTE=label"])
+        return target_ds.GetRasterBand(1).ReadAsArray()
+
+    def _label_groups(self):
+        """
+        Labels of roi features split in groups of features which do not
+        overlap, so that each group is rasterized as labels on its own and
+        pixels shared by overlapping features count for each of them
+        """
+        dataSource, layer = self._roi_layer()
+        groups = []
+        for i, feature in enumerate(layer):
+            geom = feature.GetGeometryRef()
+            if geom is None or geom.IsEmpty():
+                continue
+
+            geom = geom.Clone()
+            for group in groups:
+                if not any(
+                    geom.Intersects(other) and not geom.Touches(other)
+                    for other in group.values()
+                ):
+                    group[i + 1] = geom
+                    break
+            else:
+                groups.append({i + 1: geom})
+
+        return [set(group) for group in groups]
+
+    def _accumulate(self, window, change):
+        """
+        Accumulate statistics of roi features on a window of changes
+        """
+        if not self.statistics_enabled:
+            return
+
+        if self.zonal is None:
+            dataSource, layer = self._roi_layer()
+            bands = 1 if change.ndim == 2 else change.shape[0]
+            pixel_area = abs(self.geo[1] * self.geo[5] - self.geo[2] * self.geo[4])
+            self.zonal = LittoDynZonalStats(
+                layer.GetFeatureCount(), bands, self.change_threshold, pixel_area
+            )
+            self.label_groups = self._label_groups()
+
+        with self._stage("statistics"):
+            if len(self.label_groups) == 1:
+                self.zonal.update(change, self._labels(window))
+                return
+            for group in self.label_groups:
+                self.zonal.update(change, self._labels(window, group))
+
+    def statistics(self):
+        """
+        Names of statistics, and their values for each roi feature
+
+        Statistics are accumulated while changes are computed (see
+        LittoDynZonalStats), pixels above change_threshold being counted as
+        changed.
+        """
+        if self.zonal is None:
+            return [], []
+        return self.zonal.field_names(self._band_names()), self.zonal.results()
+
+    def _block_size(self):
+        """
+        Size of blocks read at once: the natural block size of the first
+        image, strips being grouped to avoid tiny reads
+        """
+        bx, by = self.block
+        if bx >= self.cols:
+            by *= max(1, self.window_pixels // (self.cols * by))
+        return bx, by
+
+    def _windows(self):
+        """
+        Yield (xoff, yoff, xsize, ysize) windows of the roi windows, aligned
+        on the block size of the first image
+        """
+        bx, by = self._block_size()
+        for rx, ry, rw, rh in self.roi_windows:
+            for yoff in range(ry - ry % by, ry + rh, by):
+                for xoff in range(rx - rx % bx, rx + rw, bx):
+                    x0, y0 = max(xoff, rx), max(yoff, ry)
+                    x1 = min(xoff + bx, rx + rw)
+                    y1 = min(yoff + by, ry + rh)
+                    yield (x0, y0, x1 - x0, y1 - y0)
+
+    def _detect_window(self, window, prefetched=None):
+        """
+        Run detection on a window only and return changes
+        """
+        with self._stage("load"):
+            self._load_images(window, prefetched)
+        with self._stage("mask"):
+            self._init_mask(window)
+        self.shared = {}
+        self._compute(window)
+
+        change = self.change
+        self.img1 = self.img2 = self.roi_mask = self.change = None
+        self.window = None
+        self.shared = {}
+        return change
+
+    def _detect_windows(self):
+        """
+        Yield (window, changes) for all windows, computed by a process pool
+        when workers > 1
+
+        Pool workers compute windows and changes are gathered by the main
+        process. Otherwise, with prefetch > 0, the next windows of images are
+        read in a background thread while the current one is computed, and
+        save() writes windows of changes in another one. Time spent by these
+        threads and time spent waiting for them are reported to the observer
+        as read, read_wait, write and write_wait stages.
+        """
+        windows = list(self._windows())
+        # without interpreter for workers, windows are computed here
+        context = _pool_context() if self.workers > 1 else None
+        if context is None and self.prefetch <= 0:
+            for i, window in enumerate(windows):
+                yield window, self._detect_window(window)
+                self._progress((i + 1) / len(windows))
+            return
+
+        if context is None:
+            # the reader has its own bytes_read counter, observer and cancel
+            # token stay in the main thread
+            reader = copy.copy(self)
+            reader.observer = reader.cancel = None
+            reader.bytes_read = 0
+
+            prefetcher = LittoDynPrefetchReader(
+                reader._prefetch, windows, self.prefetch
+            )
+            try:
+                for i, (window, prefetched) in enumerate(prefetcher):
+                    yield window, self._detect_window(window, prefetched)
+                    self._progress((i + 1) / len(windows))
+            finally:
+                prefetcher.close()
+                reader._release()
+                self.bytes_read += reader.bytes_read
+                self._report("read", prefetcher, reader.bytes_read)
+            return
+
+        # observer and cancel token stay in the main process
+        worker = copy.copy(self)
+        worker.observer = worker.cancel = None
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context
+        ) as executor:
+            # bound the number of windows waiting to be written
+            pending = deque()
+            done = 0
+            for window in windows:
+                self._check_cancel()
+                pending.append(executor.submit(_detect_window, worker, window))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+                    done += 1
+                    self._progress(done / len(windows))
+
+            while pending:
+                self._check_cancel()
+                yield pending.popleft().result()
+                done += 1
+                self._progress(done / len(windows))
+
+    def _report(self, stage, thread, bytes_read=0):
+        """
+        Notify the observer of the time spent by a background thread, and of
+        the time spent waiting for it
+        """
+        if self.observer is None:
+            return
+
+        self.observer.stage_started(stage)
+        self.observer.stage_finished(stage, thread.busy, bytes_read)
+        self.observer.stage_started(stage + "_wait")
+        self.observer.stage_finished(stage + "_wait", thread.wait)
 
     def detect(self):
-        self._dodetect()
-        self._apply_roi()
+        if self.windowed:
+            # changes are streamed window by window in save()
+            return
+
+        try:
+            self._compute(self.extent)
+        finally:
+            self._release()
+        self.zonal = None
+        self._accumulate(self.extent, self.change)
+
+    def _compute(self, window):
+        """
+        Detection on inputs of a window, nan outside roi
+        """
+        if self.sparse:
+            with self._stage("detect", int(np.count_nonzero(self.roi_mask))):
+                self._dodetect_sparse()
+            return
+
+        with self._stage("detect", window[2] * window[3]):
+            self._dodetect()
+        with self._stage("roi"):
+            self._apply_roi()
+
+    def _dodetect_sparse(self):
+        """
+        Detection on roi pixels only, changes being scattered back in the
+        window
+
+        Roi pixels are gathered in (bands, pixels) arrays, so that computation
+        scales with the number of roi pixels instead of the area of windows
+        (thin coastal buffers). Detectors have to work on the band axis only
+        (tileable ones).
+        """
+        self.inside = self.roi_mask != 0
+        img1, img2 = self.img1, self.img2
+        self.img1, self.img2 = self._gather(img1), self._gather(img2)
+        try:
+            self._dodetect()
+        finally:
+            self.img1, self.img2 = img1, img2
+
+        values = self.change
+        shape = values.shape[:-1] + self.inside.shape
+        self.change = np.full(shape, np.nan, dtype=self.dtype)
+        self.change[..., self.inside] = values
+        self.inside = None
+
+    def _gather(self, img):
+        """
+        Roi pixels of an image as a (bands, pixels) array in sparse detection,
+        the image itself otherwise
+        """
+        if img is None or self.inside is None:
+            return img
+        return img[:, self.inside]
+
+    def _shared(self, key, compute):
+        """
+        Intermediate result computed once for the current inputs, so that
+        intermediates needed by several detectors (band differences...) are
+        computed once when detectors are run together
+        """
+        if key not in self.shared:
+            self.shared[key] = compute()
+        return self.shared[key]
+
+    def _bind(self, cls):
+        """
+        Detector of another class working on the inputs and intermediates of
+        this one
+        """
+        detector = cls.__new__(cls)
+        detector.__dict__.update(self.__dict__)
+        return detector
 
     def _dodetect(self):
         # Generic case here, return 0
-        self.change = np.zeros([self.rows, self.cols], dtype=np.float)
+        self.change = np.zeros(self.img1.shape[1:], dtype=self.dtype)
 
     def _apply_roi(self):
-        self.change[np.where(self.roi_mask == 0)] = np.nan
-
-    def save(self, path_out):
-        driver = gdal.GetDriverByName("GTiff")
-        self.ds = driver.Create(path_out, self.cols, self.rows, 1, gdal.GDT_Float32)
-        self.ds.SetProjection(self.proj)
-        self.ds.SetGeoTransform(self.geo)
-        self.ds.GetRasterBand(1).WriteArray(self.change)
-        self.ds = None
+        self.change[..., self.roi_mask == 0] = np.nan
+
+    def _band_names(self):
+        """
+        Description of output bands, one band per name
+        """
+        return [None]
+
+    def save(
+        self, path_out, path_mask=None, threshold="otsu", percentile=90, **options
+    ):
+        """
+        Save changes in a GeoTIFF, options are given to the raster writer
+        (cog, compress, encoding...)
+
+        With path_mask, changes above a threshold are also saved as a 1 bit
+        mask (one band per band of changes). The threshold is either a value,
+        or computed with "otsu" or "percentile" method from histograms of
+        changes accumulated while saving them. path_out may be None when only
+        the mask is needed.
+
+        Int16 encoding without scale is scaled to the range of changes of each
+        band. In windowed mode, this range is only known once all windows are
+        computed: changes are then saved as floats in a temporary file, which
+        is encoded afterwards.
+        """
+        cog = options.get("cog", False)
+        scaled = options.get("encoding") == "int16" and options.get("scale") is None
+        if scaled and not self.windowed:
+            options = dict(options, **self._int16_scale(self._ranges(self.change)))
+
+        tmp = None
+        path_changes = path_out
+        changes_options = options
+        if path_out is None or (scaled and self.windowed):
+            # changes are read back to be thresholded or encoded
+            tmp = tempfile.mkdtemp()
+            path_changes = os.path.join(tmp, "changes.tif")
+            changes_options = dict(options, cog=False, encoding=None)
+
+        histograms = None
+        if (path_mask is not None and isinstance(threshold, str)) or tmp is not None:
+            histograms = [LittoDynHistogram() for _ in self._band_names()]
+
+        try:
+            self._save_changes(path_changes, histograms, **changes_options)
+
+            if path_mask is not None:
+                with self._stage("threshold"):
+                    self.thresholds = [threshold] * len(self._band_names())
+                    if isinstance(threshold, str):
+                        self.thresholds = [
+                            h.threshold(threshold, percentile) for h in histograms
+                        ]
+                    self._save_mask(path_changes, path_mask, cog)
+
+            if path_out is not None and path_changes != path_out:
+                ranges = [(h.min, h.max) for h in histograms]
+                with self._stage("encode"):
+                    self._save_encoded(
+                        path_changes,
+                        path_out,
+                        **dict(options, **self._int16_scale(ranges))
+                    )
+        finally:
+            self._release()
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self._progress(1.0)
+
+    def _ranges(self, change):
+        """
+        (min, max) of finite changes of each band, nan when there is none
+        """
+        ranges = []
+        for values in change.reshape(len(self._band_names()), -1):
+            values = values[np.isfinite(values)]
+            if values.size:
+                ranges.append((float(values.min()), float(values.max())))
+            else:
+                ranges.append((np.nan, np.nan))
+        return ranges
+
+    @staticmethod
+    def _int16_scale(ranges):
+        """
+        Int16 scale and offset of each band, so that codes span the range of
+        its changes
+        """
+        codes = np.iinfo(np.int16).max - 1
+        scale, offset = [], []
+        for low, high in ranges:
+            if not (np.isfinite(low) and np.isfinite(high)):
+                low = high = 0.0
+            offset.append((low + high) / 2.0)
+            scale.append((high - low) / (2.0 * codes) if high > low else 1.0)
+        return {"scale": scale, "offset": offset}
+
+    def _save_changes(self, path_out, histograms=None, **options):
+        """
+        Write changes, and accumulate their histograms if any
+        """
+        out = self.extent
+        if self.full_extent:
+            out = (0, 0, self.cols, self.rows)
+
+        writer = LittoDynRasterWriter(
+            path_out,
+            out[2],
+            out[3],
+            self._geo(out),
+            self.proj,
+            names=self._band_names(),
+            dtype=self.dtype,
+            **options
+        )
+        if self.windowed and self.prefetch > 0:
+            writer = LittoDynAsyncWriter(writer, self.prefetch)
+
+        try:
+            with self._stage("save"):
+                if self.windowed:
+                    self.zonal = None
+                    for window, change in self._detect_windows():
+                        self._accumulate(window, change)
+                        self._histogram(histograms, change)
+                        writer.write(change, window[0] - out[0], window[1] - out[1])
+                else:
+                    self._histogram(histograms, self.change)
+                    xoff, yoff = self.extent[0] - out[0], self.extent[1] - out[1]
+                    writer.write(self.change, xoff, yoff)
+                writer.close()
+        except Exception:
+            # cancelled or failed, partial output is removed
+            writer.discard()
+            raise
+        finally:
+            if isinstance(writer, LittoDynAsyncWriter):
+                self._report("write", writer)
+
+    def _histogram(self, histograms, change):
+        if histograms is None:
+            return
+        change = change.reshape((len(histograms), -1))
+        for histogram, values in zip(histograms, change):
+            histogram.update(values)
+
+    def _blocks(self, band):
+        """
+        Yield (xoff, yoff, xsize, ysize) blocks of a band
+        """
+        bx, by = band.GetBlockSize()
+        cols, rows = band.XSize, band.YSize
+        for yoff in range(0, rows, by):
+            self._check_cancel()
+            for xoff in range(0, cols, bx):
+                yield xoff, yoff, min(bx, cols - xoff), min(by, rows - yoff)
+
+    def _save_mask(self, path_changes, path_mask, cog=False):
+        """
+        Threshold saved changes block by block into a 1 bit mask
+        """
+        ds = gdal.Open(path_changes, gdal.GA_ReadOnly)
+        bands = [ds.GetRasterBand(i + 1) for i in range(ds.RasterCount)]
+
+        writer = LittoDynRasterWriter(
+            path_mask,
+            ds.RasterXSize,
+            ds.RasterYSize,
+            ds.GetGeoTransform(),
+            ds.GetProjection(),
+            names=self._band_names(),
+            encoding="mask",
+            cog=cog,
+        )
+
+        try:
+            for xoff, yoff, w, h in self._blocks(bands[0]):
+                mask = np.zeros((len(bands), h, w), dtype=np.uint8)
+                for i, band in enumerate(bands):
+                    values = self._decode_band(band, xoff, yoff, w, h)
+                    with np.errstate(invalid="ignore"):
+                        mask[i] = values > self.thresholds[i]
+                writer.write(mask, xoff, yoff)
+            writer.close()
+        except Exception:
+            writer.discard()
+            raise
+
+    def _save_encoded(self, path_changes, path_out, **options):
+        """
+        Copy saved changes block by block, with writer options
+        """
+        ds = gdal.Open(path_changes, gdal.GA_ReadOnly)
+        bands = [ds.GetRasterBand(i + 1) for i in range(ds.RasterCount)]
+
+        writer = LittoDynRasterWriter(
+            path_out,
+            ds.RasterXSize,
+            ds.RasterYSize,
+            ds.GetGeoTransform(),
+            ds.GetProjection(),
+            names=self._band_names(),
+            dtype=self.dtype,
+            **options
+        )
+
+        try:
+            for xoff, yoff, w, h in self._blocks(bands[0]):
+                values = np.empty((len(bands), h, w), dtype=self.dtype)
+                for i, band in enumerate(bands):
+                    values[i] = self._decode_band(band, xoff, yoff, w, h)
+                writer.write(values, xoff, yoff)
+            writer.close()
+        except Exception:
+            writer.discard()
+            raise
+
+    def _decode_band(self, band, xoff, yoff, w, h):
+        """
+        Values of a window of a band of changes, whatever its encoding
+        """
+        values = band.ReadAsArray(xoff, yoff, w, h).astype(np.float64)
+        nodata = band.GetNoDataValue()
+        invalid = np.isnan(values)
+        if nodata is not None and not np.isnan(nodata):
+            invalid |= values == nodata
+        values = values * (band.GetScale() or 1.0) + (band.GetOffset() or 0.0)
+        values[invalid] = np.nan
+        return values
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import numpy as np
+
+from .base import LittoDynChangeDetector
+
+
+class LittoDynChangeDetectorMulti(LittoDynChangeDetector):
+    """
+    Several change detectors run in a single pass
+    Inputs and roi mask are loaded once, intermediates shared by detectors are
+    computed once, and changes are saved as one band per detector
+    """
+
+    def __init__(self, path_img1, path_img2, path_roi, detectors, names=None, **kwargs):
+        self.detectors = detectors
+        self.names = names
+        if not names:
+            self.names = [
+                d.__name__.replace("LittoDynChangeDetector", "").lower()
+                for d in detectors
+            ]
+        self.tileable = all(d.tileable for d in detectors)
+        super().__init__(path_img1, path_img2, path_roi, **kwargs)
+
+    def _dodetect(self):
+        change = np.empty(
+            (len(self.detectors),) + self.img1.shape[1:], dtype=self.dtype
+        )
+        for i, cls in enumerate(self.detectors):
+            detector = self._bind(cls)
+            detector._dodetect()
+            change[i] = detector.change
+        self.change = change
+
+    def _band_names(self):
+        return self.names
@@ -18,8 +18,4 @@ class LittoDynChangeDetectorNdvi(LittoDynChangeDetectorVi):
     NDVI = (NIR-R)/(NIR+R)
     """
 
-    def _vi(self, img):
-        """
-        ndvi of image
-        """
-        return (img[:, :, 3] - img[:, :, 2]) / (img[:, :, 3] + img[:, :, 2])
+    index = "NDVI"
@@ -18,8 +18,4 @@ class LittoDynChangeDetectorNgrdi(LittoDynChangeDetectorVi):
     NGRDI= (Green - Red)/(Green + Red) `
     """
 
-    def _vi(self, img):
-        """
-        ngrdi of image
-        """
-        return (img[:, :, 1] - img[:, :, 2]) / (img[:, :, 1] + img[:, :, 2])
+    index = "NGRDI"
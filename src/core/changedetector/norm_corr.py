@@ -7,10 +7,8 @@ __date__ = "2020/10/10"
 __email__ = "blottiere.paul@gmail.com"
 __license__ = "GPLv3"
 
-import numpy as np
-from scipy.spatial import distance
-
 from .base import LittoDynChangeDetector
+from .norm_cos import cosine_distance
 
 
 class LittoDynChangeDetectorNormCorr(LittoDynChangeDetector):
@@ -19,10 +17,4 @@ class LittoDynChangeDetectorNormCorr(LittoDynChangeDetector):
     """
 
     def _dodetect(self):
-        dist = np.zeros((self.img1.shape[0], self.img1.shape[1]))
-        for i in range(self.img1.shape[0]):
-            for j in range(self.img1.shape[1]):
-                dist[i, j] = distance.correlation(
-                    self.img1[i, j, :], self.img2[i, j, :]
-                )
-        self.change = dist
+        self.change = cosine_distance(self.img1, self.img2, centered=True)
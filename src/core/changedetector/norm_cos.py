@@ -8,19 +8,47 @@ __email__ = "blottiere.paul@gmail.com"
 __license__ = "GPLv3"
 
 import numpy as np
-from scipy.spatial import distance
 
 from .base import LittoDynChangeDetector
 
 
+def cosine_distance(img1, img2, centered=False, chunk=1 << 20):
+    """
+    Cosine distance between the pixels of two images, computed along the
+    band axis by chunks of pixels. Results match scipy.spatial.distance.cosine
+    (or correlation if centered) called on each pixel: nan for zero-norm
+    vectors, clipped to [0, 2] otherwise.
+    Chunks are reduced in float64 whatever the type of images, since the
+    distance suffers from cancellation when vectors are nearly colinear.
+    Images are (bands, rows, cols) arrays, or (bands, pixels) in sparse mode.
+    """
+    bands = img1.shape[0]
+    u_all = img1.reshape(bands, -1)
+    v_all = img2.reshape(bands, -1)
+    pixels = u_all.shape[1]
+
+    dist = np.empty(pixels, dtype=img1.dtype)
+    for i in range(0, pixels, chunk):
+        u = u_all[:, i : i + chunk].astype(np.float64)
+        v = v_all[:, i : i + chunk].astype(np.float64)
+        if centered:
+            u = u - u.mean(axis=0, keepdims=True)
+            v = v - v.mean(axis=0, keepdims=True)
+
+        uv = np.einsum("kn,kn->n", u, v)
+        uu = np.einsum("kn,kn->n", u, u)
+        vv = np.einsum("kn,kn->n", v, v)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            d = 1.0 - uv / np.sqrt(uu * vv)
+        np.clip(d, 0.0, 2.0, out=dist[i : i + chunk])
+
+    return dist.reshape(img1.shape[1:])
+
+
 class LittoDynChangeDetectorNormCos(LittoDynChangeDetector):
     """
     A change with only cosine distance
     """
 
     def _dodetect(self):
-        dist = np.zeros((self.img1.shape[0], self.img1.shape[1]))
-        for i in range(self.img1.shape[0]):
-            for j in range(self.img1.shape[1]):
-                dist[i, j] = distance.cosine(self.img1[i, j, :], self.img2[i, j, :])
-        self.change = dist
+        self.change = cosine_distance(self.img1, self.img2)
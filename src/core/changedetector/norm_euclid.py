@@ -18,4 +18,5 @@ class LittoDynChangeDetectorNormEuclid(LittoDynChangeDetector):
     """
 
     def _dodetect(self):
-        self.change = np.sqrt(np.sum((self.img1 - self.img2) ** 2, axis=2))
+        diff = self._shared("diff", lambda: self.img1 - self.img2)
+        self.change = np.sqrt(np.einsum("k...,k...->...", diff, diff))
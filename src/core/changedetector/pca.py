@@ -18,60 +18,127 @@ from .base import LittoDynChangeDetector
 class LittoDynChangeDetectorPca(LittoDynChangeDetector):
     """
     A change detector with PCA + kmeans
+    Set seed to get reproducible change maps
+
+    With block_size h > 1, the feature vector of a pixel is made of the
+    differences of its h x h neighborhood (all bands), which is more robust to
+    noise. Neighborhoods are strided views of the difference image, and are
+    only gathered by chunks of pixels to be projected on the first components
+    principal components (as many as bands by default). PCA is then fitted on
+    a random sample of roi pixels, while the per-pixel mode fits it on all of
+    them.
     """
 
+    # clustering is global to the roi
+    tileable = False
+
+    seed = None
+
+    block_size = 1
+
+    components = None
+
+    # roi pixels used to fit PCA on neighborhoods, and pixels projected at once
+    sample_size = 1 << 17
+    chunk = 1 << 16
+
+    def __init__(self, *args, seed=None, block_size=1, components=None, **kwargs):
+        if block_size < 1 or block_size % 2 == 0:
+            raise ValueError("Block size must be a positive odd number")
+
+        self.seed = seed
+        self.block_size = block_size
+        self.components = components
+        super().__init__(*args, **kwargs)
+
     def _find_vector_set(self, diff_image):
-        self.isdata = np.where(self.roi_mask)
-        vector_set = np.zeros(
-            [len(self.isdata[0]), diff_image.shape[2]], dtype=np.float
-        )
-        for i in range(len(self.isdata[0])):
-            vector_set[i, :] = diff_image[self.isdata[0][i], self.isdata[1][i], :]
+        self.isdata = self.roi_mask != 0
+        vector_set = diff_image[:, self.isdata].T
         mean_vec = np.mean(vector_set, axis=0)
-        vector_set -= mean_vec
 
         return vector_set, mean_vec
 
-    def _find_FVS(self, EVS, diff_image, mean_vec):
-        feature_vector_set = np.zeros(
-            [len(self.isdata[0]), diff_image.shape[2]], dtype=np.float
+    def _find_FVS(self, EVS, vector_set, mean_vec):
+        FVS = np.dot(vector_set, EVS)
+        FVS = FVS - mean_vec
+        return FVS
+
+    def _sample(self, n):
+        """
+        Sorted indices of roi pixels used to fit PCA, all of them if few
+        """
+        if n <= self.sample_size:
+            return slice(None)
+
+        rng = np.random.RandomState(self.seed)
+        return np.sort(rng.choice(n, self.sample_size, replace=False))
+
+    def _block_features(self, blocks, ys, xs):
+        """
+        Feature vectors of pixels, from the h x h neighborhood of all bands
+        """
+        return blocks[:, ys, xs].transpose(1, 0, 2, 3).reshape(len(ys), -1)
+
+    def _block_FVS(self, diff_image):
+        """
+        Projection of the neighborhood features of roi pixels on principal
+        components, computed by chunks
+        """
+        self.isdata = self.roi_mask != 0
+        ys, xs = np.nonzero(self.isdata)
+
+        # image borders are extended, then each pixel has a h x h view
+        r = self.block_size // 2
+        padded = np.pad(diff_image, ((0, 0), (r, r), (r, r)), mode="edge")
+        blocks = np.lib.stride_tricks.sliding_window_view(
+            padded, (self.block_size, self.block_size), axis=(1, 2)
         )
-        for i in range(len(self.isdata[0])):
-            feature_vector_set[i, :] = diff_image[
-                self.isdata[0][i], self.isdata[1][i], :
-            ]
 
-        FVS = np.dot(feature_vector_set, EVS)
-        FVS = FVS - mean_vec
+        sample = self._sample(len(ys))
+        vector_set = self._block_features(blocks, ys[sample], xs[sample])
+        mean_vec = np.mean(vector_set, axis=0)
+
+        components = self.components or diff_image.shape[0]
+        pca = PCA(n_components=components, random_state=self.seed)
+        pca.fit(vector_set - mean_vec)
+        EVS = pca.components_.T.astype(self.dtype, copy=False)
+        del vector_set
+
+        FVS = np.empty((len(ys), EVS.shape[1]), dtype=self.dtype)
+        for start in range(0, len(ys), self.chunk):
+            stop = start + self.chunk
+            features = self._block_features(blocks, ys[start:stop], xs[start:stop])
+            FVS[start:stop] = np.dot(features - mean_vec, EVS)
         return FVS
 
     def _clustering(self, FVS, components, new):
 
-        kmeans = KMeans(components, verbose=0)
+        kmeans = KMeans(components, verbose=0, random_state=self.seed)
         kmeans.fit(FVS)
         output = kmeans.predict(FVS)
         count = Counter(output)
 
         max_index = max(count, key=count.get)
-        change_map = np.zeros(new) + np.nan
-        for i in range(len(self.isdata[0])):
-            change_map[self.isdata[0][i], self.isdata[1][i]] = output[i]
+        change_map = np.full(new, np.nan, dtype=self.dtype)
+        change_map[self.isdata] = output
 
         return max_index, change_map
 
     def _dodetect(self):
 
-        diff_image = np.abs(self.img1 - self.img2)
+        diff_image = np.abs(self._shared("diff", lambda: self.img1 - self.img2))
 
-        vector_set, mean_vec = self._find_vector_set(diff_image)
+        if self.block_size > 1:
+            FVS = self._block_FVS(diff_image)
+        else:
+            # roi pixels are gathered once, and centered for PCA fitting only
+            vector_set, mean_vec = self._find_vector_set(diff_image)
 
-        pca = PCA()
-        pca.fit(vector_set)
-        EVS = pca.components_
+            pca = PCA(random_state=self.seed)
+            pca.fit(vector_set - mean_vec)
+            EVS = pca.components_.astype(self.dtype, copy=False)
 
-        FVS = self._find_FVS(EVS, diff_image, mean_vec)
+            FVS = self._find_FVS(EVS, vector_set, mean_vec)
 
         components = 3
-        max_index, self.change = self._clustering(
-            FVS, components, [diff_image.shape[0], diff_image.shape[1]]
-        )
+        max_index, self.change = self._clustering(FVS, components, diff_image.shape[1:])
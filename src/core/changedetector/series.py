@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import tempfile
+
+import numpy as np
+
+from ..cache import index_cache, raster_cache
+from .base import LittoDynChangeDetector
+from .ndvi import LittoDynChangeDetectorNdvi
+
+
+class LittoDynChangeDetectorSeries(LittoDynChangeDetector):
+    """
+    Change detection over an ordered stack of images with a vegetation index
+    (detector is one of the LittoDynChangeDetectorVi subclasses)
+    Index of each date is computed once, and kept in the index cache so that
+    adding a date to the series only costs the index of the new date. With an
+    index store (a LittoDynIndexStore), indexes are also saved on disk, one
+    entry per date and roi, so that they are reused by pool workers and
+    between sessions.
+    Changes are saved as one band per consecutive pair of dates, or per pair
+    (first date, date) if cumulative.
+    """
+
+    def __init__(
+        self,
+        paths,
+        path_roi,
+        detector=LittoDynChangeDetectorNdvi,
+        cumulative=False,
+        index_store=None,
+        **kwargs
+    ):
+        self.paths = list(paths)
+        self.sources = list(paths)
+        if len(self.paths) < 2:
+            raise ValueError("At least two images are needed for a series")
+
+        self.detector = detector
+        self.cumulative = cumulative
+        self.index_store = index_store
+        super().__init__(self.paths[0], self.paths[-1], path_roi, **kwargs)
+        # dates are read on the grid of the first one
+        self.paths[1:] = [self._coregister(p) for p in self.paths[1:]]
+
+    def _load_images(self, window=None, prefetched=None):
+        # dates are read one by one when computing their index
+        self.window = window
+        self.img1 = self.img2 = None
+
+    def _prefetch(self, window):
+        # indexes of dates may be cached, nothing is read ahead
+        return None
+
+    def _index_key(self, path, window):
+        """
+        Key of the index of a date on a window, None if the date is not a
+        local file
+        """
+        key = raster_cache.key(path, self.bands, window, self.dtype, self.scale)
+        if key is None:
+            return None
+
+        key += (self.detector.__name__, tuple(self.roi_windows))
+        if self.inside is not None:
+            # roi pixels only, of the roi mask of the window
+            key += (self._roi_hash(),)
+        return key
+
+    def _store_key(self, key):
+        """
+        Entry of the index store of a date, for all of its windows
+        """
+        # key without its window (see LittoDynRasterCache.key), as windows are
+        # files of the entry
+        date = key[:4] + key[5:]
+        return self.index_store.key([], [], [], {"index": date})
+
+    @staticmethod
+    def _store_name(window):
+        return "{}_{}_{}_{}.npy".format(*window)
+
+    def _load_index(self, key, window):
+        path = self.index_store.file(self._store_key(key), self._store_name(window))
+        if path is None:
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def _store_index(self, key, window, vi):
+        fd, path = tempfile.mkstemp(suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, vi)
+            self.index_store.add(self._store_key(key), self._store_name(window), path)
+        except OSError:
+            # indexes are computed again next time
+            pass
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _index(self, path):
+        """
+        Vegetation index of a date on the current window
+        """
+        window = self.window or self.extent
+        key = None
+        if self.cache or self.index_store is not None:
+            key = self._index_key(path, window)
+        if key is not None and self.cache:
+            vi = index_cache.get(key)
+            if vi is not None:
+                return vi
+        if key is not None and self.index_store is not None:
+            vi = self._load_index(key, window)
+            if vi is not None:
+                if self.cache:
+                    index_cache.put(key, vi)
+                return vi
+
+        # intermediates are not shared between dates
+        detector = self._bind(self.detector)
+        detector.shared = {}
+        vi = detector._vi(self._gather(self._read_window(path, self.window)))
+        if key is not None and self.index_store is not None:
+            self._store_index(key, window, vi)
+        if key is not None and self.cache:
+            index_cache.put(key, vi)
+        return vi
+
+    def save(self, path_out, *args, **kwargs):
+        try:
+            super().save(path_out, *args, **kwargs)
+        finally:
+            # indexes of all windows are stored, entries are evicted once
+            if self.index_store is not None:
+                self.index_store.evict()
+
+    def _dodetect(self):
+        first = previous = self._index(self.paths[0])
+
+        change = np.empty((len(self.paths) - 1,) + first.shape, dtype=self.dtype)
+        for i, path in enumerate(self.paths[1:]):
+            vi = self._index(path)
+            reference = first if self.cumulative else previous
+            np.abs(vi - reference, out=change[i])
+            previous = vi
+
+        self.change = change
+
+    def _band_names(self):
+        names = [os.path.splitext(os.path.basename(p))[0] for p in self.sources]
+        first = names[0]
+        bands = []
+        for i in range(1, len(names)):
+            reference = first if self.cumulative else names[i - 1]
+            bands.append("{}_{}".format(reference, names[i]))
+        return bands
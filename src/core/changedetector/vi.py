@@ -9,6 +9,7 @@ __license__ = "GPLv3"
 
 import numpy as np
 
+from .. import bandmath, registry
 from .base import LittoDynChangeDetector
 
 
@@ -20,20 +21,53 @@ class LittoDynChangeDetectorVi(LittoDynChangeDetector):
     2 : Green
     3 : Red
     4 : Infra Red
+    Index is the name of an expression of the band math registry
     """
 
+    index = None
+
     def _dodetect(self):
         """
         For vegetaion indexes we always return abs diff between the vegetation indexes of input images
         """
 
         vi1 = self._vi(self.img1)
-        vi2 = self._vi(self.img2)
-        dist = np.zeros((self.img1.shape[0], self.img1.shape[1]))
-        self.change = np.abs(vi2 - vi1)
+        change = self._vi(self.img2)
+        np.subtract(change, vi1, out=change)
+        self.change = np.abs(change, out=change)
 
-    def _vi(self):
+    def _vi(self, img):
         """
         Vegetation index
         """
-        pass
+        return bandmath.index(self.index).evaluate(img)
+
+
+def index_detector(name):
+    """
+    Change detector class of an index of the band math registry, so that new
+    indexes do not need a module. Registered detectors of the index are used
+    when any.
+    """
+    name = name.upper()
+    for spec in registry.indices():
+        if spec.index == name:
+            return spec.load()
+    return _index_detector(name)
+
+
+def _index_detector(name):
+    cls_name = "LittoDynChangeDetector{}".format(name.capitalize())
+    if cls_name not in globals():
+        bandmath.index(name)
+        # defined in this module, so that detectors can be pickled
+        cls = type(cls_name, (LittoDynChangeDetectorVi,), {"index": name})
+        cls.__module__ = __name__
+        globals()[cls_name] = cls
+    return globals()[cls_name]
+
+
+# registered, as loaded from this module
+LittoDynChangeDetectorSavi = _index_detector("SAVI")
+LittoDynChangeDetectorNdwi = _index_detector("NDWI")
+LittoDynChangeDetectorMndwi = _index_detector("MNDWI")
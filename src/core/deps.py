@@ -7,7 +7,7 @@ __date__ = "2020/10/10"
 __email__ = "blottiere.paul@gmail.com"
 __license__ = "GPLv3"
 
-import importlib
+import importlib.util
 import subprocess
 from sys import platform
 
@@ -18,17 +18,18 @@ class Deps(object):
         if platform != "win32":
             return
 
-        deps = ["numpy", "scipy", "gdal", "scikit-learn"]
+        # pip package: module, looked up without being imported so that
+        # QGIS startup does not pay for loading them
+        deps = {
+            "numpy": "numpy",
+            "scipy": "scipy",
+            "gdal": "osgeo",
+            "scikit-learn": "sklearn",
+        }
 
         missing = []
-        for dep in deps:
-            try:
-                if dep == "scikit-learn":
-                    dep = "sklearn"
-                importlib.import_module(dep)
-            except ModuleNotFoundError:
-                if dep == "sklearn":
-                    dep = "scikit-learn"
+        for dep, module in deps.items():
+            if importlib.util.find_spec(module) is None:
                 missing.append(dep)
 
         if not missing:
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import threading
+
+
+class LittoDynCancelled(Exception):
+    """
+    Raised by a detector when its cancel token is cancelled
+    """
+
+
+class LittoDynCancelToken(object):
+    """
+    Cancellation token checked by detectors between stages and windows
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+
+class LittoDynObserver(object):
+    """
+    Observer of a detection: stages (load, mask, detect, roi, save), with
+    elapsed time in seconds, decoded bytes and processed pixels, and progress
+    between 0 and 1. Default implementation does nothing.
+    """
+
+    def stage_started(self, stage):
+        pass
+
+    def stage_finished(self, stage, elapsed, bytes_read=0, pixels=0):
+        pass
+
+    def progress(self, fraction):
+        pass
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import time
+import queue
+import threading
+
+_END = object()
+
+
+class LittoDynPrefetchReader(object):
+    """
+    Iterator of (item, read(item)) over items, where read() is run in a
+    background thread up to depth items ahead of the consumer
+
+    GDAL releases the GIL while decoding, so the next windows are read while
+    the current one is computed. busy is the time spent reading, and wait the
+    time the consumer spent waiting for data.
+    """
+
+    def __init__(self, read, items, depth=2):
+        self.read = read
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.stop = threading.Event()
+        self.busy = 0.0
+        self.wait = 0.0
+        self.thread = threading.Thread(target=self._run, args=(list(items),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self, items):
+        try:
+            for item in items:
+                start = time.perf_counter()
+                data = self.read(item)
+                self.busy += time.perf_counter() - start
+                if not self._put((item, data, None)):
+                    return
+            self._put((_END, None, None))
+        except Exception as e:
+            self._put((None, None, e))
+
+    def _put(self, entry):
+        """
+        Blocking put, given up when the reader is closed
+        """
+        while not self.stop.is_set():
+            try:
+                self.queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        item, data, error = self.queue.get()
+        self.wait += time.perf_counter() - start
+
+        if error is not None:
+            raise error
+        if item is _END:
+            self.queue.put((_END, None, None))
+            raise StopIteration
+        return item, data
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+
+class LittoDynAsyncWriter(object):
+    """
+    Raster writer running writes in a background thread, with at most depth
+    windows waiting to be written. busy is the time spent writing, and wait
+    the time the producer spent waiting for the queue (and for pending writes
+    on close).
+    """
+
+    def __init__(self, writer, depth=2):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=max(1, depth))
+        self.error = None
+        self.busy = 0.0
+        self.wait = 0.0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            entry = self.queue.get()
+            if entry is _END:
+                return
+            if self.error is not None:
+                # keep on draining the queue so that the producer never blocks
+                continue
+
+            try:
+                start = time.perf_counter()
+                self.writer.write(*entry)
+                self.busy += time.perf_counter() - start
+            except Exception as e:
+                self.error = e
+
+    def _join(self):
+        start = time.perf_counter()
+        self.queue.put(_END)
+        self.thread.join()
+        self.wait += time.perf_counter() - start
+
+    def write(self, data, xoff, yoff):
+        if self.error is not None:
+            raise self.error
+
+        start = time.perf_counter()
+        self.queue.put((data, xoff, yoff))
+        self.wait += time.perf_counter() - start
+
+    def close(self):
+        self._join()
+        if self.error is not None:
+            self.writer.discard()
+            raise self.error
+        self.writer.close()
+
+    def discard(self):
+        if self.thread.is_alive():
+            self._join()
+        self.writer.discard()
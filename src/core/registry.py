@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import importlib
+import importlib.util
+from collections import OrderedDict
+
+
+class LittoDynDetectorSpec(object):
+    """
+    Declaration of a change detector: where its class lives and what it needs
+
+    Nothing is imported until load() is called, so that listing detectors
+    (for a dialog or a manifest) never pays for numpy, GDAL or scikit-learn.
+    bands is the number of input bands needed, and index the spectral index
+    of detectors usable on time series.
+    """
+
+    def __init__(
+        self,
+        name,
+        label,
+        module,
+        cls,
+        index=None,
+        bands=1,
+        requires=(),
+    ):
+        self.name = name
+        self.label = label
+        self.module = module
+        self.cls = cls
+        self.index = index
+        self.bands = bands
+        self.requires = tuple(requires)
+        self._class = None
+
+    def missing(self):
+        """
+        Required modules which are not installed, found without importing them
+        """
+        return [m for m in self.requires if importlib.util.find_spec(m) is None]
+
+    def load(self):
+        """
+        Detector class, importing its module on first call
+        """
+        if self._class is None:
+            module = importlib.import_module(
+                ".changedetector.{}".format(self.module), __package__
+            )
+            self._class = getattr(module, self.cls)
+        return self._class
+
+
+# ordered as in the processing dialog, whose enum values are saved in models
+detectors = OrderedDict()
+
+
+def register(spec):
+    detectors[spec.name] = spec
+    return spec
+
+
+def detector(name):
+    try:
+        return detectors[name.upper()]
+    except KeyError:
+        raise ValueError("Unknown detector '{}'".format(name))
+
+
+def indices():
+    """
+    Detectors of spectral indices, usable on time series
+    """
+    return [spec for spec in detectors.values() if spec.index is not None]
+
+
+# bands are counted in bandmath order: B, G, R, NIR, SWIR
+register(
+    LittoDynDetectorSpec(
+        "PCA",
+        "PCA",
+        "pca",
+        "LittoDynChangeDetectorPca",
+        requires=("sklearn",),
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "EVI", "EVI", "evi", "LittoDynChangeDetectorEvi", index="EVI", bands=4
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "NDVI", "NDVI", "ndvi", "LittoDynChangeDetectorNdvi", index="NDVI", bands=4
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "NGRDI", "NGRDI", "ngrdi", "LittoDynChangeDetectorNgrdi", index="NGRDI", bands=3
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "EUCL", "Euclidean Norm", "norm_euclid", "LittoDynChangeDetectorNormEuclid"
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "CORR", "Correlation Norm", "norm_corr", "LittoDynChangeDetectorNormCorr"
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "COS", "Cosine Norm", "norm_cos", "LittoDynChangeDetectorNormCos"
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "SAVI", "SAVI", "vi", "LittoDynChangeDetectorSavi", index="SAVI", bands=4
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "NDWI", "NDWI", "vi", "LittoDynChangeDetectorNdwi", index="NDWI", bands=4
+    )
+)
+register(
+    LittoDynDetectorSpec(
+        "MNDWI", "MNDWI", "vi", "LittoDynChangeDetectorMndwi", index="MNDWI", bands=5
+    )
+)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+
+
+class LittoDynResultCache(object):
+    """
+    Cache of detection results on disk, shared between sessions
+
+    An entry is a directory named by the hash of everything the result depends
+    on: identity of input files (path, modification time and size), roi
+    geometries, algorithms and parameters. It holds the output rasters and a
+    meta.json file of results which are not rasters (thresholds, statistics),
+    whose modification time is the last access. Entries are written in a
+    temporary directory renamed when complete, and least recently used
+    entries are removed when the cache grows over max_bytes.
+    """
+
+    # bumped when outputs of a same key may change
+    version = 1
+
+    def __init__(self, root=None, max_bytes=2 << 30):
+        self.root = root or os.path.join(tempfile.gettempdir(), "littodyn_results")
+        self.max_bytes = max_bytes
+
+    def key(self, paths, roi, algorithms, options):
+        """
+        Key of a result, None if an input is not a local file
+        """
+        h = hashlib.sha1()
+        inputs = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except (OSError, TypeError):
+                return None
+            inputs.append([os.path.realpath(path), stat.st_mtime_ns, stat.st_size])
+
+        description = {
+            "version": self.version,
+            "inputs": inputs,
+            "algorithms": list(algorithms),
+            "options": options,
+        }
+        h.update(json.dumps(description, sort_keys=True, default=str).encode())
+        for geom in roi:
+            h.update(hashlib.sha1(bytes(geom)).digest())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """
+        Paths of files and meta of an entry, None on miss
+        """
+        if key is None or self.max_bytes <= 0:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                entry = json.load(f)
+            files = {
+                name: os.path.join(path, filename)
+                for name, filename in entry["files"].items()
+            }
+            if not all(os.path.exists(p) for p in files.values()):
+                return None
+            os.utime(os.path.join(path, "meta.json"))
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return files, entry["meta"]
+
+    def put(self, key, files, meta=None):
+        """
+        Store files, as a dict of name: path, and json serializable meta
+        """
+        if key is None or self.max_bytes <= 0:
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, ".{}.{}".format(key, uuid.uuid4().hex))
+        os.makedirs(tmp)
+        try:
+            names = {}
+            for name, path in files.items():
+                names[name] = os.path.basename(path)
+                shutil.copyfile(path, os.path.join(tmp, names[name]))
+
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump({"files": names, "meta": meta or {}}, f)
+
+            # an entry written by another process meanwhile is kept
+            if os.path.exists(self._path(key)):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                os.rename(tmp, self._path(key))
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        self.evict()
+
+    @staticmethod
+    def restore(path, dest):
+        """
+        Make a cached file available at dest, hard linked when possible so
+        that the copy survives eviction without being copied
+        """
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+        return dest
+
+    def entries(self):
+        """
+        (last access, size, path) of complete entries
+        """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            meta = os.path.join(path, "meta.json")
+            if name.startswith("."):
+                continue
+            # entries may be removed meanwhile by another process
+            try:
+                files = os.listdir(path)
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in files)
+                entries.append((os.path.getmtime(meta), size, path))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries, and temporary directories left by
+        crashed writers, until the cache fits in max_bytes
+        """
+        if not os.path.isdir(self.root):
+            return
+
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith(".") and now - os.path.getmtime(path) > 86400:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+        entries = sorted(self.entries())
+        nbytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if nbytes <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            nbytes -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class LittoDynIndexStore(LittoDynResultCache):
+    """
+    Store of intermediate rasters on disk, such as indexes of time series
+
+    An entry holds the files of an input (the windows of the index of a
+    date), added one by one as they are computed, possibly by several
+    processes. Least recently used entries are only removed by evict(),
+    called once per run.
+    """
+
+    def file(self, key, name):
+        """
+        Path of a file of an entry, None on miss
+        """
+        if key is None or self.max_bytes <= 0:
+            return None
+
+        path = os.path.join(self._path(key), name)
+        if not os.path.exists(path):
+            return None
+        try:
+            os.utime(os.path.join(self._path(key), "meta.json"))
+        except OSError:
+            return None
+        return path
+
+    def add(self, key, name, path):
+        """
+        Move a file in an entry, created on first file
+        """
+        if key is None or self.max_bytes <= 0:
+            return
+
+        entry = self._path(key)
+        meta = os.path.join(entry, "meta.json")
+        os.makedirs(entry, exist_ok=True)
+        if not os.path.exists(meta):
+            with open(meta, "w") as f:
+                json.dump({"files": {}, "meta": {}}, f)
+
+        # moved next to the entry first, so that the file appears complete
+        tmp = os.path.join(entry, ".{}.{}".format(name, uuid.uuid4().hex))
+        try:
+            shutil.move(path, tmp)
+            os.replace(tmp, os.path.join(entry, name))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
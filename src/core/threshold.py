@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import numpy as np
+
+
+class LittoDynHistogram(object):
+    """
+    Histogram of values accumulated chunk by chunk, without keeping values
+
+    Bins have a constant width over a range which starts as the range of the
+    first chunk, and which is doubled (merging pairs of bins) whenever values
+    fall out of it. Thresholds are then computed from bins: percentiles are
+    interpolated within bins, and Otsu threshold is a bin edge. Minimum and
+    maximum values are exact.
+    """
+
+    def __init__(self, bins=4096):
+        self.bins = bins
+        self.hist = np.zeros(bins, dtype=np.int64)
+        self.low = None
+        self.width = None
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        """
+        Accumulate finite values of an array
+        """
+        values = values[np.isfinite(values)].astype(np.float64)
+        if not values.size:
+            return
+
+        vmin, vmax = values.min(), values.max()
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+        if self.low is None:
+            self.low = vmin
+            span = max(vmax - vmin, abs(vmin) * 1e-6, 1e-12)
+            self.width = span / self.bins
+            # last value falls in the last bin
+            self.width *= 1 + 1e-9
+
+        while vmin < self.low or vmax >= self.low + self.width * self.bins:
+            self._expand(vmin < self.low)
+
+        idx = ((values - self.low) / self.width).astype(np.intp)
+        np.clip(idx, 0, self.bins - 1, out=idx)
+        self.hist += np.bincount(idx, minlength=self.bins)
+        self.count += values.size
+
+    def _expand(self, downwards):
+        """
+        Double the range, down or up, merging pairs of bins
+        """
+        half = self.bins // 2
+        merged = self.hist.reshape(half, 2).sum(axis=1)
+        self.hist = np.zeros(self.bins, dtype=np.int64)
+        if downwards:
+            self.hist[half:] = merged
+            self.low -= self.width * self.bins
+        else:
+            self.hist[:half] = merged
+        self.width *= 2
+
+    def edges(self):
+        return self.low + self.width * np.arange(self.bins + 1)
+
+    def percentile(self, q):
+        """
+        Approximate q-th percentile of values
+        """
+        if not self.count:
+            return np.nan
+
+        rank = q / 100.0 * self.count
+        cumulated = np.cumsum(self.hist)
+        i = min(int(np.searchsorted(cumulated, rank)), self.bins - 1)
+        before = cumulated[i] - self.hist[i]
+        fraction = (rank - before) / self.hist[i] if self.hist[i] else 0.0
+        return float(self.low + (i + fraction) * self.width)
+
+    def otsu(self):
+        """
+        Threshold maximizing the between-class variance of values below and
+        above it
+        """
+        if not self.count:
+            return np.nan
+
+        centers = self.low + self.width * (np.arange(self.bins) + 0.5)
+        weights = self.hist.astype(np.float64)
+        w0 = np.cumsum(weights)
+        w1 = self.count - w0
+        m0 = np.cumsum(weights * centers)
+        m1 = m0[-1] - m0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            between = w0 * w1 * (m0 / w0 - m1 / w1) ** 2
+        between[~np.isfinite(between)] = -1
+        return float(self.low + self.width * (np.argmax(between) + 1))
+
+    def threshold(self, method="otsu", percentile=90):
+        """
+        Threshold with "otsu" or "percentile" method
+        """
+        if method == "otsu":
+            return self.otsu()
+        if method == "percentile":
+            return self.percentile(percentile)
+        raise ValueError("Unknown threshold method '{}'".format(method))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+from osgeo import gdal
+
+
+class LittoDynRasterWriter(object):
+    """
+    Tiled and compressed GeoTIFF writer, to which windows of data are written
+    as they are computed. NaN is declared as nodata.
+
+    With cog, windows are written in a temporary file whose overviews are
+    built on close, and which is then copied to a cloud optimized GeoTIFF
+    (overviews and tiles ordered for HTTP range requests).
+
+    Data may be encoded as Float32/Float64 (same type as data), as Int16 with
+    scale and offset (value = scale * code + offset, -32768 for nodata), as
+    Float16 or as a 1 bit mask (0 or 1 values, no nodata). Int16 scale and
+    offset are given for all bands or per band, and values out of the Int16
+    range raise a ValueError instead of being clipped.
+    """
+
+    INT16_NODATA = -32768
+
+    def __init__(
+        self,
+        path,
+        cols,
+        rows,
+        geo,
+        proj,
+        names=None,
+        dtype=np.float32,
+        compress="DEFLATE",
+        cog=False,
+        encoding=None,
+        scale=None,
+        offset=0.0,
+        blocksize=512,
+        threads="ALL_CPUS",
+    ):
+        self.path = path
+        self.names = names or [None]
+        self.dtype = np.dtype(dtype)
+        self.cog = cog
+        self.encoding = encoding
+
+        if encoding == "int16" and scale is None:
+            raise ValueError("Int16 encoding needs a scale")
+        bands = len(self.names)
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), (bands,))
+        self.offset = np.broadcast_to(np.asarray(offset, dtype=np.float64), (bands,))
+
+        datatype = gdal.GDT_Float32
+        if self.dtype == np.float64:
+            datatype = gdal.GDT_Float64
+        predictor = "3"
+        if encoding == "float16":
+            # GTiff only supports 16 bits floats as Float32 with NBITS
+            datatype = gdal.GDT_Float32
+        elif encoding == "int16":
+            datatype = gdal.GDT_Int16
+            predictor = "2"
+        elif encoding == "mask":
+            datatype = gdal.GDT_Byte
+            predictor = "1"
+
+        self.options = [
+            "TILED=YES",
+            "BLOCKXSIZE={}".format(blocksize),
+            "BLOCKYSIZE={}".format(blocksize),
+            "COMPRESS={}".format(compress),
+            "PREDICTOR={}".format(predictor),
+            "NUM_THREADS={}".format(threads),
+            "BIGTIFF=IF_SAFER",
+        ]
+        if encoding == "float16":
+            self.options.append("NBITS=16")
+        elif encoding == "mask":
+            self.options.append("NBITS=1")
+
+        self.path_tmp = path
+        if cog:
+            self.path_tmp = "{}.tmp.tif".format(os.path.splitext(path)[0])
+
+        driver = gdal.GetDriverByName("GTiff")
+        self.ds = driver.Create(
+            self.path_tmp,
+            cols,
+            rows,
+            len(self.names),
+            datatype,
+            # blocks out of the roi windows are never written
+            self.options + ["SPARSE_OK=TRUE"],
+        )
+        self.ds.SetProjection(proj)
+        self.ds.SetGeoTransform(geo)
+
+        self.bands = [self.ds.GetRasterBand(i + 1) for i in range(len(self.names))]
+        for i, (band, name) in enumerate(zip(self.bands, self.names)):
+            if name:
+                band.SetDescription(name)
+            if encoding == "int16":
+                band.SetNoDataValue(self.INT16_NODATA)
+                band.SetScale(float(self.scale[i]))
+                band.SetOffset(float(self.offset[i]))
+            elif encoding != "mask":
+                band.SetNoDataValue(np.nan)
+
+    def _encode(self, data, i=0):
+        if self.encoding == "mask":
+            return data.astype(np.uint8)
+        if self.encoding == "float16":
+            return data.astype(np.float32, copy=False)
+        if self.encoding != "int16":
+            return data
+
+        code = np.round((data - self.offset[i]) / self.scale[i])
+        nan = np.isnan(data)
+        low, high = self.INT16_NODATA + 1, np.iinfo(np.int16).max
+        with np.errstate(invalid="ignore"):
+            out = (code < low) | (code > high)
+        if out.any():
+            raise ValueError(
+                "{} values out of Int16 range [{:g}, {:g}] with scale {:g} "
+                "and offset {:g}".format(
+                    int(out.sum()),
+                    low * self.scale[i] + self.offset[i],
+                    high * self.scale[i] + self.offset[i],
+                    self.scale[i],
+                    self.offset[i],
+                )
+            )
+        code[nan] = self.INT16_NODATA
+        return code.astype(np.int16)
+
+    def write(self, data, xoff, yoff):
+        """
+        Write a (bands, rows, cols) or (rows, cols) window at an offset
+        """
+        data = data.reshape((len(self.bands),) + data.shape[-2:])
+        for i, (band, band_data) in enumerate(zip(self.bands, data)):
+            band.WriteArray(self._encode(band_data, i), xoff, yoff)
+
+    def close(self):
+        if self.cog:
+            self._overviews()
+
+            driver = gdal.GetDriverByName("GTiff")
+            ds = driver.CreateCopy(
+                self.path, self.ds, options=self.options + ["COPY_SRC_OVERVIEWS=YES"]
+            )
+            ds = None
+
+        self.bands = None
+        self.ds = None
+
+        if self.cog:
+            gdal.GetDriverByName("GTiff").Delete(self.path_tmp)
+
+    def discard(self):
+        """
+        Close and remove the output, when writing is interrupted
+        """
+        self.bands = None
+        self.ds = None
+        driver = gdal.GetDriverByName("GTiff")
+        for path in {self.path, self.path_tmp}:
+            if os.path.exists(path):
+                driver.Delete(path)
+
+    def _overviews(self):
+        """
+        Build overviews down to the size of a block
+        """
+        levels = []
+        level = 2
+        size = max(self.ds.RasterXSize, self.ds.RasterYSize)
+        while size // level >= 256:
+            levels.append(level)
+            level *= 2
+
+        if levels:
+            resampling = "NEAREST" if self.encoding == "mask" else "AVERAGE"
+            self.ds.BuildOverviews(resampling, levels)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import math
+
+import numpy as np
+
+
+class LittoDynZonalStats(object):
+    """
+    Statistics of changes per roi feature, accumulated window by window from
+    a raster of feature labels (1 for the first feature, 0 outside roi)
+
+    Count, sum, sum of squares, min, max and number of changed pixels (above
+    threshold) are exact. Percentiles come from a histogram with bins of
+    constant relative width between low and high (changes are positive), and
+    are interpolated within bins.
+    """
+
+    bins = 512
+    low = 1e-6
+    high = 1e6
+    percentiles = (10, 50, 90)
+
+    def __init__(self, features, bands=1, threshold=None, pixel_area=1.0):
+        self.features = features
+        self.bands = bands
+        self.threshold = threshold
+        self.pixel_area = pixel_area
+
+        # label 0 is outside roi
+        shape = (bands, features + 1)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape)
+        self.sumsq = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.changed = np.zeros(shape, dtype=np.int64)
+        self.hist = np.zeros(shape + (self.bins,), dtype=np.int64)
+
+        # first bin is [0, low[
+        self.edges = np.concatenate(
+            ([0.0], np.geomspace(self.low, self.high, self.bins))
+        )
+
+    def update(self, change, labels):
+        """
+        Accumulate changes of a window, (bands, rows, cols) or (rows, cols),
+        with labels of features as a (rows, cols) array
+        """
+        n = self.features + 1
+        values = change.reshape(self.bands, -1)
+        labels = labels.reshape(-1)
+
+        for b in range(self.bands):
+            valid = (labels > 0) & np.isfinite(values[b])
+            lab = labels[valid].astype(np.intp)
+            val = values[b, valid].astype(np.float64)
+            if not lab.size:
+                continue
+
+            self.count[b] += np.bincount(lab, minlength=n)
+            self.sum[b] += np.bincount(lab, weights=val, minlength=n)
+            self.sumsq[b] += np.bincount(lab, weights=val * val, minlength=n)
+            np.minimum.at(self.min[b], lab, val)
+            np.maximum.at(self.max[b], lab, val)
+            if self.threshold is not None:
+                self.changed[b] += np.bincount(
+                    lab, weights=val > self.threshold, minlength=n
+                ).astype(np.int64)
+
+            idx = np.searchsorted(self.edges, val, side="right") - 1
+            np.clip(idx, 0, self.bins - 1, out=idx)
+            self.hist[b] += np.bincount(
+                lab * self.bins + idx, minlength=n * self.bins
+            ).reshape(n, self.bins)
+
+    def _percentile(self, b, label, q):
+        hist = self.hist[b, label]
+        rank = q / 100.0 * self.count[b, label]
+        cumulated = np.cumsum(hist)
+        i = int(np.searchsorted(cumulated, rank))
+        i = min(i, self.bins - 1)
+
+        # interpolation within bin, geometric except for the first one
+        before = cumulated[i] - hist[i]
+        fraction = (rank - before) / hist[i] if hist[i] else 0.0
+        lo = self.edges[i]
+        hi = self.edges[i + 1] if i + 1 < self.bins else self.edges[i] * 2
+        if i == 0:
+            value = lo + fraction * (hi - lo)
+        else:
+            value = lo * math.pow(hi / lo, fraction)
+        return float(min(max(value, self.min[b, label]), self.max[b, label]))
+
+    def _stat_names(self):
+        stats = ["count", "mean", "std", "min", "max"]
+        stats += ["p{}".format(q) for q in self.percentiles]
+        if self.threshold is not None:
+            stats += ["changed_area"]
+        return stats
+
+    def field_names(self, names=None):
+        """
+        Names of statistics, prefixed by band names when several bands
+        """
+        names = names or [None] * self.bands
+        stats = self._stat_names()
+
+        fields = []
+        for name in names:
+            prefix = "{}_".format(name) if name and self.bands > 1 else ""
+            fields += [prefix + stat for stat in stats]
+        return fields
+
+    def results(self):
+        """
+        Statistics of each feature, as a list of values ordered like
+        field_names(), None when a feature has no valid pixel
+        """
+        missing = [0] + [None] * (len(self._stat_names()) - 1)
+        results = []
+        for label in range(1, self.features + 1):
+            values = []
+            for b in range(self.bands):
+                count = int(self.count[b, label])
+                if not count:
+                    values += missing
+                    continue
+
+                mean = self.sum[b, label] / count
+                var = max(self.sumsq[b, label] / count - mean * mean, 0.0)
+                values += [
+                    count,
+                    float(mean),
+                    math.sqrt(var),
+                    float(self.min[b, label]),
+                    float(self.max[b, label]),
+                ]
+                values += [self._percentile(b, label, q) for q in self.percentiles]
+                if self.threshold is not None:
+                    values.append(float(self.changed[b, label] * self.pixel_area))
+            results.append(values)
+        return results
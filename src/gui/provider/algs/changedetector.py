@@ -11,15 +11,15 @@ import os
 import tempfile
 from qgis.PyQt.QtGui import QIcon
 
-from qgis.PyQt.QtCore import QCoreApplication
+from qgis.PyQt.QtCore import QCoreApplication, QVariant
 from qgis.PyQt.QtWidgets import QComboBox, QLineEdit
 
 from qgis import processing
 from qgis.core import (
     Qgis,
+    QgsField,
     QgsFields,
     QgsProject,
-    QgsWkbTypes,
     QgsMapLayer,
     QgsGeometry,
     QgsMessageLog,
@@ -28,29 +28,29 @@ from qgis.core import (
     QgsRasterLayer,
     QgsVectorLayer,
     QgsProcessingUtils,
-    QgsVectorFileWriter,
     QgsProcessingContext,
     QgsProcessingException,
     QgsProcessingAlgorithm,
     QgsProcessingParameterEnum,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterDefinition,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterRasterDestination,
+    QgsProcessingOutputRasterLayer,
 )
 
 from processing.gui.wrappers import WidgetWrapper
 from processing.core.ProcessingConfig import ProcessingConfig
 
-from littodyn.src.core.changedetector.evi import LittoDynChangeDetectorEvi
-from littodyn.src.core.changedetector.pca import LittoDynChangeDetectorPca
-from littodyn.src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
-from littodyn.src.core.changedetector.ngrdi import LittoDynChangeDetectorNgrdi
-from littodyn.src.core.changedetector.norm_cos import LittoDynChangeDetectorNormCos
-from littodyn.src.core.changedetector.norm_corr import LittoDynChangeDetectorNormCorr
-from littodyn.src.core.changedetector.norm_euclid import (
-    LittoDynChangeDetectorNormEuclid,
-)
+from littodyn.src.core import registry
+from littodyn.src.core.observer import LittoDynCancelled
+from littodyn.src.core.results import LittoDynResultCache
+
+from littodyn.src.gui.task import LittoDynDetectionTask, task_queue
+
+from .feedback import LittoDynFeedbackObserver
 
 
 class LittoDynRasterComboBoxWrapper(WidgetWrapper):
@@ -178,8 +178,21 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
     INPUT_RASTER_2 = "INPUT_RASTER_2"
     INPUT_ALG_NAME = "INPUT_ALG_NAME"
     INFO_DATE = "INFO_DATE"
+    INPUT_FULL_EXTENT = "INPUT_FULL_EXTENT"
+    INPUT_WORKERS = "INPUT_WORKERS"
+    INPUT_PREVIEW_SCALE = "INPUT_PREVIEW_SCALE"
+    INPUT_BUILD_OVERVIEWS = "INPUT_BUILD_OVERVIEWS"
+    INPUT_COG = "INPUT_COG"
+    INPUT_ENCODING = "INPUT_ENCODING"
+    INPUT_BACKGROUND = "INPUT_BACKGROUND"
+    INPUT_STATISTICS = "INPUT_STATISTICS"
+    INPUT_CHANGE_THRESHOLD = "INPUT_CHANGE_THRESHOLD"
     OUTPUT_BUFFER = "OUTPUT_BUFFER"
     OUTPUT_CHANGES = "OUTPUT_CHANGES"
+    OUTPUT_MASK = "OUTPUT_MASK"
+    INPUT_MASK = "INPUT_MASK"
+    INPUT_THRESHOLD_METHOD = "INPUT_THRESHOLD_METHOD"
+    INPUT_THRESHOLD_PERCENTILE = "INPUT_THRESHOLD_PERCENTILE"
 
     def tr(self, string):
         return QCoreApplication.translate("Processing", string)
@@ -198,23 +211,23 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
         return self.tr("Change Detection")
 
     def shortHelpString(self):
-        return self.tr("Change Detection")
+        return self.tr(
+            "Change Detection\n\n"
+            "In background, the algorithm returns as soon as the detection is "
+            "submitted, without changes output: changes are loaded in the "
+            "project when the task is done, so they cannot be used by a next "
+            "step of a model."
+        )
 
     def initAlgorithm(self, config=None):
-        self.options = [
-            "PCA",
-            "EVI",
-            "NDVI",
-            "NGRDI",
-            "Euclidean Norm",
-            "Correlation Norm",
-            "Cosine Norm",
-        ]
+        self.specs = list(registry.detectors.values())
+        self.options = [spec.label for spec in self.specs]
         self.addParameter(
             QgsProcessingParameterEnum(
                 self.INPUT_ALG_NAME,
                 self.tr("Algorithm"),
                 options=self.options,
+                allowMultiple=True,
                 defaultValue=0,
             )
         )
@@ -237,6 +250,115 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
             LittoDynDateParameter(self.INFO_DATE, self.tr("Days between rasters"))
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_FULL_EXTENT,
+                self.tr("Write changes at full raster extent"),
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr("Number of worker processes"),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_PREVIEW_SCALE,
+                self.tr("Preview scale factor (1 for full resolution)"),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_BUILD_OVERVIEWS,
+                self.tr("Build missing overviews for preview"),
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_COG,
+                self.tr("Write changes as Cloud Optimized GeoTIFF"),
+                defaultValue=False,
+            )
+        )
+
+        self.encodings = [None, "int16", "float16"]
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_ENCODING,
+                self.tr("Changes encoding"),
+                options=["Float", "Int16 (scaled)", "Float16"],
+                defaultValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_BACKGROUND,
+                self.tr("Run detection in background (changes loaded when done)"),
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_STATISTICS,
+                self.tr("Compute change statistics of each feature"),
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_CHANGE_THRESHOLD,
+                self.tr("Change threshold for changed area and mask"),
+                QgsProcessingParameterNumber.Double,
+                optional=True,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_MASK,
+                self.tr("Save a binary mask of changes above threshold"),
+                defaultValue=False,
+            )
+        )
+
+        # used when no change threshold is given
+        self.threshold_methods = ["otsu", "percentile"]
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_THRESHOLD_METHOD,
+                self.tr("Automatic threshold"),
+                options=["Otsu", "Percentile"],
+                defaultValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_THRESHOLD_PERCENTILE,
+                self.tr("Percentile of changes for automatic threshold"),
+                QgsProcessingParameterNumber.Double,
+                defaultValue=90,
+                minValue=0,
+                maxValue=100,
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT_BUFFER, self.tr("Buffered extent")
@@ -249,23 +371,118 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        self.addOutput(
+            QgsProcessingOutputRasterLayer(self.OUTPUT_MASK, self.tr("Change mask"))
+        )
+
+    def detectorClass(self, alg):
+        # detector modules, and their dependencies, are only imported here
+        return self.specs[alg].load()
+
+    def createDetector(self, path1, path2, roi, classes, names, observer, **options):
+        from littodyn.src.core.changedetector.multi import (
+            LittoDynChangeDetectorMulti,
+        )
+
+        if len(classes) == 1:
+            return classes[0](
+                path1, path2, roi, observer=observer, cancel=observer, **options
+            )
+
+        # inputs are read once and changes are saved as one band per algorithm
+        return LittoDynChangeDetectorMulti(
+            path1,
+            path2,
+            roi,
+            classes,
+            names,
+            observer=observer,
+            cancel=observer,
+            **options
+        )
+
+    def resultCache(self):
+        root = ProcessingConfig.getSetting("LITTODYN_RESULT_CACHE_DIR")
+        size = ProcessingConfig.getSetting("LITTODYN_RESULT_CACHE_SIZE")
+        size = 2048 if size is None else int(size)
+        return LittoDynResultCache(root or None, size * 1024 * 1024)
+
     def processAlgorithm(self, parameters, context, feedback):
         # extract input parameters
-        alg = self.parameterAsEnum(parameters, self.INPUT_ALG_NAME, context)
+        algs = self.parameterAsEnums(parameters, self.INPUT_ALG_NAME, context)
+        if not algs:
+            raise QgsProcessingException(self.tr("No algorithm selected"))
 
         extent = self.parameterAsVectorLayer(parameters, self.INPUT_EXTENT, context)
 
+        full_extent = self.parameterAsBool(parameters, self.INPUT_FULL_EXTENT, context)
+
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+
+        scale = self.parameterAsInt(parameters, self.INPUT_PREVIEW_SCALE, context)
+        build_overviews = self.parameterAsBool(
+            parameters, self.INPUT_BUILD_OVERVIEWS, context
+        )
+
+        cog = self.parameterAsBool(parameters, self.INPUT_COG, context)
+        encoding = self.parameterAsEnum(parameters, self.INPUT_ENCODING, context)
+        save_options = {"cog": cog, "encoding": self.encodings[encoding]}
+
+        background = self.parameterAsBool(parameters, self.INPUT_BACKGROUND, context)
+
+        statistics = self.parameterAsBool(parameters, self.INPUT_STATISTICS, context)
+        threshold = None
+        if parameters.get(self.INPUT_CHANGE_THRESHOLD) is not None:
+            threshold = self.parameterAsDouble(
+                parameters, self.INPUT_CHANGE_THRESHOLD, context
+            )
+        if statistics and background:
+            feedback.pushInfo(self.tr("Statistics are not computed in background"))
+            statistics = False
+
+        names = [self.options[alg].lower().replace(" ", "_") for alg in algs]
+
         raster_1_id = self.parameterAsString(parameters, self.INPUT_RASTER_1, context)
         raster_1 = QgsProject.instance().mapLayer(raster_1_id)
 
         raster_2_id = self.parameterAsString(parameters, self.INPUT_RASTER_2, context)
         raster_2 = QgsProject.instance().mapLayer(raster_2_id)
 
-        (sink, self.dest_id) = self.parameterAsSink(
+        for alg in algs:
+            spec = self.specs[alg]
+            missing = spec.missing()
+            if missing:
+                raise QgsProcessingException(
+                    self.tr("{} needs missing modules: {}").format(
+                        spec.label, ", ".join(missing)
+                    )
+                )
+            for raster in (raster_1, raster_2):
+                if raster.bandCount() < spec.bands:
+                    raise QgsProcessingException(
+                        self.tr("{} needs {} bands, {} has {}").format(
+                            spec.label, spec.bands, raster.name(), raster.bandCount()
+                        )
+                    )
+
+        from littodyn.src.core.cache import raster_cache
+        from littodyn.src.core.zonal import LittoDynZonalStats
+
+        # statistics of changes are attributes of buffers, one band per
+        # algorithm
+        fields = QgsFields()
+        if statistics:
+            band_names = names if len(names) > 1 else None
+            stats = LittoDynZonalStats(0, len(names), threshold)
+            for name in stats.field_names(band_names):
+                vtype = QVariant.Int if name.endswith("count") else QVariant.Double
+                fields.append(QgsField(name, vtype))
+
+        sink, self.dest_id = self.parameterAsSink(
             parameters,
             self.OUTPUT_BUFFER,
             context,
-            QgsFields(),
+            fields,
             extent.wkbType(),
             extent.sourceCrs(),
         )
@@ -274,50 +491,63 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
             parameters, self.OUTPUT_CHANGES, context
         )
 
-        # create a temporary vector layer
-        tmp = tempfile.mkdtemp()
-        path_roi = os.path.join(tmp, "roi.shp")
-        writer = QgsVectorFileWriter(
-            path_roi,
-            "UTF-8",
-            QgsFields(),
-            QgsWkbTypes.Polygon,
-            extent.sourceCrs(),
-            "ESRI Shapefile",
-        )
-
-        # create buffered extent and update temporary shp for detector
+        # create buffered extent, geometries are given to the detector in
+        # memory
+        roi = []
+        buffers = []
         for feature in extent.getFeatures():
             geom = feature.geometry()
             buffer = geom.buffer(
                 10, 100, QgsGeometry.CapFlat, QgsGeometry.JoinStyleMiter, 100
             )
             feature.setGeometry(buffer)
-            feature.setFields(QgsFields())
-            sink.addFeature(feature)
-            writer.addFeature(feature)
-        del writer
-
-        # run change detector
+            feature.setFields(fields)
+            buffers.append(feature)
+            roi.append(bytes(buffer.asWkb()))
+
+        if not statistics:
+            for feature in buffers:
+                sink.addFeature(feature)
+
+        # decoded inputs are kept between runs in the raster cache
+        cache_size = ProcessingConfig.getSetting("LITTODYN_CACHE_SIZE")
+        if cache_size is not None:
+            raster_cache.resize(int(cache_size) * 1024 * 1024)
+        hits, misses = raster_cache.hits, raster_cache.misses
+
+        # run change detector, reporting progress and timings in feedback
+        observer = LittoDynFeedbackObserver(feedback)
         path1 = raster_1.source()
         path2 = raster_2.source()
-        detector = LittoDynChangeDetectorPca(path1, path2, path_roi)
-        if alg == 1:
-            detector = LittoDynChangeDetectorEvi(path1, path2, path_roi)
-        elif alg == 2:
-            detector = LittoDynChangeDetectorNdvi(path1, path2, path_roi)
-        elif alg == 3:
-            detector = LittoDynChangeDetectorNgrdi(path1, path2, path_roi)
-        elif alg == 4:
-            detector = LittoDynChangeDetectorNormEuclid(path1, path2, path_roi)
-        elif alg == 5:
-            detector = LittoDynChangeDetectorNormCorr(path1, path2, path_roi)
-        elif alg == 6:
-            detector = LittoDynChangeDetectorNormCos(path1, path2, path_roi)
-        detector.detect()
+
+        # stream inputs by windows when the detector allows it, so that large
+        # scenes do not have to fit in memory, only read the roi windows and
+        # only compute pixels of the buffer. Decoded windows are kept in the
+        # raster cache for the next runs on the same rasters.
+        options = {
+            "windowed": True,
+            "cache": True,
+            "roi_only": True,
+            "sparse": True,
+            "full_extent": full_extent,
+            "workers": workers,
+            "roi_srs": extent.sourceCrs().toWkt(),
+            "scale": scale,
+            "build_overviews": build_overviews,
+            "statistics": statistics,
+            "change_threshold": threshold,
+        }
+
+        def create(observer):
+            classes = [self.detectorClass(alg) for alg in algs]
+            return self.createDetector(
+                path1, path2, roi, classes, names, observer=observer, **options
+            )
 
         # store output layers in group
-        alg_name = self.options[alg].lower().replace(" ", "_")
+        alg_name = "_".join(names)
+        if scale > 1:
+            alg_name = "{}_preview{}".format(alg_name, scale)
         if Qgis.QGIS_VERSION_INT >= 31500:
             name = "{}_{}_{}".format(raster_1.name(), raster_2.name(), alg_name)
             ProcessingConfig.setSettingValue(ProcessingConfig.RESULTS_GROUP_NAME, name)
@@ -325,7 +555,103 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
         # save result in temporary file
         tmp = tempfile.mkdtemp()
         path_changes = os.path.join(tmp, "{}_changes.tif".format(alg_name))
-        detector.save(path_changes)
+
+        path_mask = None
+        if self.parameterAsBool(parameters, self.INPUT_MASK, context):
+            path_mask = os.path.join(tmp, "{}_mask.tif".format(alg_name))
+            method = self.parameterAsEnum(
+                parameters, self.INPUT_THRESHOLD_METHOD, context
+            )
+            save_options.update(
+                path_mask=path_mask,
+                threshold=(
+                    self.threshold_methods[method] if threshold is None else threshold
+                ),
+                percentile=self.parameterAsDouble(
+                    parameters, self.INPUT_THRESHOLD_PERCENTILE, context
+                ),
+            )
+
+        # a run with the same inputs, roi, algorithms and parameters reuses
+        # the result cache
+        cache = self.resultCache()
+        key = cache.key(
+            [path1, path2],
+            roi,
+            names,
+            {
+                "detector": {k: v for k, v in options.items() if k != "workers"},
+                "save": {k: v for k, v in save_options.items() if k != "path_mask"},
+                "mask": path_mask is not None,
+            },
+        )
+
+        def store(detector):
+            files = {"changes": path_changes}
+            meta = {}
+            if path_mask is not None:
+                files["mask"] = path_mask
+                meta["thresholds"] = detector.thresholds
+            if statistics:
+                meta["statistics"] = detector.statistics()[1]
+            try:
+                cache.put(key, files, meta)
+            except OSError as e:
+                QgsMessageLog.logMessage(
+                    "Result not cached: {}".format(e), "LittoDyn", Qgis.Warning
+                )
+
+        hit = cache.get(key)
+        if hit is not None:
+            files, meta = hit
+            cache.restore(files["changes"], path_changes)
+            if path_mask is not None:
+                cache.restore(files["mask"], path_mask)
+            thresholds = meta.get("thresholds")
+            results = meta.get("statistics")
+            feedback.pushInfo(self.tr("Changes loaded from result cache"))
+        elif background:
+            # changes are loaded in the project when the task is done
+            task = LittoDynDetectionTask(
+                self.tr("Change detection {}").format(alg_name),
+                create,
+                path_changes,
+                "{}_changes".format(alg_name),
+                store=store,
+                **save_options
+            )
+            task_queue.max_tasks = int(
+                ProcessingConfig.getSetting("LITTODYN_MAX_TASKS") or 1
+            )
+            task_queue.submit(task)
+            feedback.pushInfo(self.tr("Change detection submitted in background"))
+
+            # changes do not exist yet, so that they are not an output
+            return {self.OUTPUT_BUFFER: self.dest_id}
+        else:
+            try:
+                detector = create(observer)
+                detector.detect()
+                detector.save(path_changes, **save_options)
+            except LittoDynCancelled:
+                raise QgsProcessingException(self.tr("Change detection canceled"))
+
+            thresholds = detector.thresholds if path_mask is not None else None
+            results = detector.statistics()[1] if statistics else None
+            store(detector)
+
+            observer.summary()
+            feedback.pushInfo(
+                self.tr("Raster cache: {} hits, {} misses").format(
+                    raster_cache.hits - hits, raster_cache.misses - misses
+                )
+            )
+
+        if statistics:
+            # features are in the order of roi geometries
+            for feature, values in zip(buffers, results):
+                feature.setAttributes(values)
+                sink.addFeature(feature)
 
         rl = QgsRasterLayer(path_changes, "{}_changes".format(alg_name), "gdal")
         context.temporaryLayerStore().addMapLayer(rl)
@@ -336,8 +662,26 @@ class LittoDynChangeDetectorAlgorithm(QgsProcessingAlgorithm):
             ),
         )
 
-        return {
+        results = {
             self.OUTPUT_CHANGES: rl.id(),
             self.OUTPUT_BUFFER: self.dest_id,
             self.OUTPUT_CHANGES: rl.id(),
         }
+
+        if path_mask is not None:
+            feedback.pushInfo(
+                self.tr("Mask thresholds: {}").format(
+                    ", ".join("{:g}".format(t) for t in thresholds)
+                )
+            )
+            ml = QgsRasterLayer(path_mask, "{}_mask".format(alg_name), "gdal")
+            context.temporaryLayerStore().addMapLayer(ml)
+            context.addLayerToLoadOnCompletion(
+                ml.id(),
+                QgsProcessingContext.LayerDetails(
+                    "{}_mask".format(alg_name), context.project(), self.OUTPUT_MASK
+                ),
+            )
+            results[self.OUTPUT_MASK] = ml.id()
+
+        return results
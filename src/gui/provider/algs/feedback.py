@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from littodyn.src.core.observer import LittoDynObserver
+
+
+class LittoDynFeedbackObserver(LittoDynObserver):
+    """
+    Forward detector progress to processing feedback, use it as cancel token,
+    and sum stage timings for a summary in the log
+    """
+
+    def __init__(self, feedback):
+        self.feedback = feedback
+        self.stages = {}
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def stage_finished(self, stage, elapsed, bytes_read=0, pixels=0):
+        count, total, total_bytes, total_pixels = self.stages.get(stage, (0, 0, 0, 0))
+        self.stages[stage] = (
+            count + 1,
+            total + elapsed,
+            total_bytes + bytes_read,
+            total_pixels + pixels,
+        )
+
+    def progress(self, fraction):
+        self.feedback.setProgress(100 * fraction)
+
+    def is_cancelled(self):
+        return self.feedback.isCanceled()
+
+    def summary(self):
+        for stage, (count, elapsed, bytes_read, pixels) in self.stages.items():
+            msg = self.tr("{}: {:.2f} s ({} calls)").format(stage, elapsed, count)
+            if bytes_read:
+                msg += self.tr(", {:.1f} MB read").format(bytes_read / 1024 / 1024)
+            if pixels:
+                msg += self.tr(", {:.0f} pixels/s").format(pixels / max(elapsed, 1e-9))
+            self.feedback.pushInfo(msg)
+
+        # time the main thread waited for inputs and outputs, synchronous
+        # reads included, against time spent computing changes
+        stages = {s: v[1] for s, v in self.stages.items()}
+        io_wait = sum(stages.get(s, 0) for s in ("load", "read_wait", "write_wait"))
+        compute = sum(stages.get(s, 0) for s in ("mask", "detect", "roi"))
+        if io_wait or compute:
+            self.feedback.pushInfo(
+                self.tr("I/O wait: {:.2f} s, compute: {:.2f} s").format(
+                    io_wait, compute
+                )
+            )
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+from qgis.PyQt.QtGui import QIcon
+
+from qgis.PyQt.QtCore import QCoreApplication
+
+from qgis.core import (
+    QgsGeometry,
+    QgsProcessing,
+    QgsProcessingException,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterRasterDestination,
+)
+
+from processing.core.ProcessingConfig import ProcessingConfig
+
+from littodyn.src.core import registry
+from littodyn.src.core.observer import LittoDynCancelled
+
+from .feedback import LittoDynFeedbackObserver
+
+
+class LittoDynTimeSeriesAlgorithm(QgsProcessingAlgorithm):
+    INPUT_EXTENT = "INPUT_EXTENT"
+    INPUT_RASTERS = "INPUT_RASTERS"
+    INPUT_INDEX = "INPUT_INDEX"
+    INPUT_CUMULATIVE = "INPUT_CUMULATIVE"
+    INPUT_WORKERS = "INPUT_WORKERS"
+    OUTPUT_CHANGES = "OUTPUT_CHANGES"
+
+    def tr(self, string):
+        return QCoreApplication.translate("Processing", string)
+
+    def icon(self):
+        cwd = os.path.dirname(os.path.realpath(__file__))
+        return QIcon(os.path.join(cwd, "icon.png"))
+
+    def createInstance(self):
+        return LittoDynTimeSeriesAlgorithm()
+
+    def name(self):
+        return "timeseries"
+
+    def displayName(self):
+        return self.tr("Time Series Change Detection")
+
+    def shortHelpString(self):
+        return self.tr(
+            "Change Detection over a series of rasters ordered by date, with "
+            "one band per consecutive pair of dates (or per pair with the "
+            "first date if cumulative)"
+        )
+
+    def initAlgorithm(self, config=None):
+        self.specs = registry.indices()
+        self.options = [spec.label for spec in self.specs]
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.INPUT_INDEX,
+                self.tr("Index"),
+                options=self.options,
+                defaultValue=1,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.INPUT_EXTENT, self.tr("Extent"), [QgsProcessing.TypeVectorPolygon]
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.INPUT_RASTERS, self.tr("Rasters"), QgsProcessing.TypeRaster
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INPUT_CUMULATIVE,
+                self.tr("Cumulative changes since first date"),
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.INPUT_WORKERS,
+                self.tr("Number of worker processes"),
+                QgsProcessingParameterNumber.Integer,
+                defaultValue=1,
+                minValue=1,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(
+                self.OUTPUT_CHANGES, self.tr("Changes")
+            )
+        )
+
+    def detectorClass(self, index):
+        return self.specs[index].load()
+
+    def begin(self, layer):
+        """
+        Date of a raster layer, None if not temporal
+        """
+        properties = layer.temporalProperties()
+        if not properties.isActive():
+            return None
+        return properties.fixedTemporalRange().begin()
+
+    def indexStore(self):
+        from littodyn.src.core.results import LittoDynIndexStore
+
+        root = ProcessingConfig.getSetting("LITTODYN_INDEX_CACHE_DIR")
+        size = ProcessingConfig.getSetting("LITTODYN_INDEX_CACHE_SIZE")
+        size = 1024 if size is None else int(size)
+        return LittoDynIndexStore(root or None, size * 1024 * 1024)
+
+    def processAlgorithm(self, parameters, context, feedback):
+        index = self.parameterAsEnum(parameters, self.INPUT_INDEX, context)
+        extent = self.parameterAsVectorLayer(parameters, self.INPUT_EXTENT, context)
+        rasters = self.parameterAsLayerList(parameters, self.INPUT_RASTERS, context)
+        cumulative = self.parameterAsBool(parameters, self.INPUT_CUMULATIVE, context)
+        workers = self.parameterAsInt(parameters, self.INPUT_WORKERS, context)
+        path_changes = self.parameterAsOutputLayer(
+            parameters, self.OUTPUT_CHANGES, context
+        )
+
+        if len(rasters) < 2:
+            raise QgsProcessingException(self.tr("At least two rasters are needed"))
+
+        # order rasters by date when temporal properties are available
+        if all(self.begin(raster) is not None for raster in rasters):
+            rasters = sorted(rasters, key=lambda raster: self.begin(raster))
+
+        roi = []
+        for feature in extent.getFeatures():
+            buffer = feature.geometry().buffer(
+                10, 100, QgsGeometry.CapFlat, QgsGeometry.JoinStyleMiter, 100
+            )
+            roi.append(bytes(buffer.asWkb()))
+
+        from littodyn.src.core.changedetector.series import (
+            LittoDynChangeDetectorSeries,
+        )
+
+        observer = LittoDynFeedbackObserver(feedback)
+        try:
+            detector = LittoDynChangeDetectorSeries(
+                [raster.source() for raster in rasters],
+                roi,
+                detector=self.detectorClass(index),
+                cumulative=cumulative,
+                windowed=True,
+                roi_only=True,
+                sparse=True,
+                cache=True,
+                # indexes of dates are shared with workers and next sessions
+                index_store=self.indexStore(),
+                workers=workers,
+                roi_srs=extent.sourceCrs().toWkt(),
+                observer=observer,
+                cancel=observer,
+            )
+            detector.detect()
+            detector.save(path_changes)
+        except LittoDynCancelled:
+            raise QgsProcessingException(self.tr("Change detection canceled"))
+
+        observer.summary()
+
+        return {self.OUTPUT_CHANGES: path_changes}
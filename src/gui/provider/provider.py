@@ -9,14 +9,96 @@ __license__ = "GPLv3"
 
 import os
 from qgis.PyQt.QtGui import QIcon
-from qgis.core import QgsProcessingProvider
+from qgis.core import QgsApplication, QgsProcessingProvider
+from processing.core.ProcessingConfig import ProcessingConfig, Setting
 
 from .algs.changedetector import LittoDynChangeDetectorAlgorithm
+from .algs.timeseries import LittoDynTimeSeriesAlgorithm
 
 
 class LittoDynProvider(QgsProcessingProvider):
+    CACHE_SIZE = "LITTODYN_CACHE_SIZE"
+    MAX_TASKS = "LITTODYN_MAX_TASKS"
+    RESULT_CACHE_DIR = "LITTODYN_RESULT_CACHE_DIR"
+    RESULT_CACHE_SIZE = "LITTODYN_RESULT_CACHE_SIZE"
+    INDEX_CACHE_DIR = "LITTODYN_INDEX_CACHE_DIR"
+    INDEX_CACHE_SIZE = "LITTODYN_INDEX_CACHE_SIZE"
+
+    def load(self):
+        ProcessingConfig.settingIcons[self.name()] = self.icon()
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.CACHE_SIZE,
+                self.tr("Raster cache size (MB)"),
+                1024,
+                valuetype=Setting.INT,
+            )
+        )
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.MAX_TASKS,
+                self.tr("Maximum number of background detections"),
+                2,
+                valuetype=Setting.INT,
+            )
+        )
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.RESULT_CACHE_DIR,
+                self.tr("Result cache folder"),
+                os.path.join(
+                    QgsApplication.qgisSettingsDirPath(), "littodyn", "results"
+                ),
+                valuetype=Setting.FOLDER,
+            )
+        )
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.RESULT_CACHE_SIZE,
+                self.tr("Result cache size (MB, 0 to disable)"),
+                2048,
+                valuetype=Setting.INT,
+            )
+        )
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.INDEX_CACHE_DIR,
+                self.tr("Time series index cache folder"),
+                os.path.join(
+                    QgsApplication.qgisSettingsDirPath(), "littodyn", "indexes"
+                ),
+                valuetype=Setting.FOLDER,
+            )
+        )
+        ProcessingConfig.addSetting(
+            Setting(
+                self.name(),
+                self.INDEX_CACHE_SIZE,
+                self.tr("Time series index cache size (MB, 0 to disable)"),
+                1024,
+                valuetype=Setting.INT,
+            )
+        )
+        ProcessingConfig.readSettings()
+        self.refreshAlgorithms()
+        return True
+
+    def unload(self):
+        ProcessingConfig.removeSetting(self.CACHE_SIZE)
+        ProcessingConfig.removeSetting(self.MAX_TASKS)
+        ProcessingConfig.removeSetting(self.RESULT_CACHE_DIR)
+        ProcessingConfig.removeSetting(self.RESULT_CACHE_SIZE)
+        ProcessingConfig.removeSetting(self.INDEX_CACHE_DIR)
+        ProcessingConfig.removeSetting(self.INDEX_CACHE_SIZE)
+
     def loadAlgorithms(self, *args, **kwargs):
         self.addAlgorithm(LittoDynChangeDetectorAlgorithm())
+        self.addAlgorithm(LittoDynTimeSeriesAlgorithm())
 
     def id(self, *args, **kwargs):
         return "littodyn"
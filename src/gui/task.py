@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+from qgis.core import (
+    Qgis,
+    QgsTask,
+    QgsProject,
+    QgsApplication,
+    QgsMessageLog,
+    QgsRasterLayer,
+)
+
+from littodyn.src.core.observer import LittoDynObserver, LittoDynCancelled
+
+
+class LittoDynTaskObserver(LittoDynObserver):
+    """
+    Forward detector progress to a task, and use it as cancel token
+    """
+
+    def __init__(self, task):
+        self.task = task
+
+    def progress(self, fraction):
+        self.task.setProgress(100 * fraction)
+
+    def is_cancelled(self):
+        return self.task.isCanceled()
+
+
+class LittoDynDetectionTask(QgsTask):
+    """
+    Change detection run in a background thread. The detector is built by
+    create(observer) in the task, given to store(detector) once saved if
+    any, and changes (and the mask of changes, if any) are loaded in the
+    project on completion.
+    """
+
+    def __init__(
+        self, description, create, path_out, layer_name, store=None, **options
+    ):
+        super().__init__(description, QgsTask.CanCancel)
+        self.create = create
+        self.path_out = path_out
+        self.layer_name = layer_name
+        self.store = store
+        self.options = options
+        self.thresholds = None
+        self.error = None
+
+    def run(self):
+        try:
+            detector = self.create(LittoDynTaskObserver(self))
+            detector.detect()
+            detector.save(self.path_out, **self.options)
+            if self.options.get("path_mask") is not None:
+                self.thresholds = detector.thresholds
+            if self.store is not None:
+                self.store(detector)
+        except LittoDynCancelled:
+            return False
+        except Exception as e:
+            self.error = e
+            return False
+        return True
+
+    def finished(self, result):
+        if result:
+            layer = QgsRasterLayer(self.path_out, self.layer_name, "gdal")
+            QgsProject.instance().addMapLayer(layer)
+
+            path_mask = self.options.get("path_mask")
+            if path_mask is not None:
+                name = os.path.splitext(os.path.basename(path_mask))[0]
+                layer = QgsRasterLayer(path_mask, name, "gdal")
+                QgsProject.instance().addMapLayer(layer)
+                QgsMessageLog.logMessage(
+                    "{}: mask thresholds {}".format(
+                        self.description(),
+                        ", ".join("{:g}".format(t) for t in self.thresholds),
+                    ),
+                    "LittoDyn",
+                    Qgis.Info,
+                )
+        elif self.error is not None:
+            QgsMessageLog.logMessage(
+                "{}: {}".format(self.description(), self.error),
+                "LittoDyn",
+                Qgis.Critical,
+            )
+
+
+class LittoDynTaskQueue(object):
+    """
+    Queue of detection tasks, with at most max_tasks tasks running at once
+    """
+
+    def __init__(self, max_tasks=2):
+        self.max_tasks = max_tasks
+        self.waiting = []
+        # references are kept until tasks are done
+        self.running = []
+
+    def submit(self, task):
+        self.waiting.append(task)
+        self._next()
+
+    def _next(self):
+        while self.waiting and len(self.running) < self.max_tasks:
+            task = self.waiting.pop(0)
+            task.taskCompleted.connect(lambda task=task: self._done(task))
+            task.taskTerminated.connect(lambda task=task: self._done(task))
+            self.running.append(task)
+            QgsApplication.taskManager().addTask(task)
+
+    def _done(self, task):
+        if task in self.running:
+            self.running.remove(task)
+        self._next()
+
+
+task_queue = LittoDynTaskQueue()
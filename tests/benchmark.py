@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+# Benchmark of change detectors on synthetic 4 bands rasters
+#
+# Each (algorithm, size) case runs in a fresh process, so that its peak RSS is
+# measured alone. Stages (load, mask, detect, roi, save...) are timed by the
+# observer of detectors, summed over windows in windowed mode where save
+# includes the stages of windows, and stages run in pool workers are not
+# timed. Outputs are compared with reference rasters when available. Results
+# are written as JSON:
+#
+#   $ PYTHONPATH=$(pwd) python tests/benchmark.py --sizes 1000 5000 \
+#       --output bench.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from src.core import registry
+from src.core.observer import LittoDynObserver
+
+# detectors are only imported by the cases using them
+ALGOS = registry.detectors
+
+BANDS = 4
+BLOCK = 512
+PIXEL_SIZE = 3.0
+ORIGIN = (300000.0, 5200000.0)
+
+
+def generate(workdir, size):
+    """
+    Synthetic pair of BANDS bands uint16 rasters and roi, written block by
+    block
+    """
+    paths = [
+        os.path.join(workdir, "img1_{}.tif".format(size)),
+        os.path.join(workdir, "img2_{}.tif".format(size)),
+    ]
+    roi = os.path.join(workdir, "roi_{}.shp".format(size))
+    if all(os.path.exists(p) for p in paths + [roi]):
+        return paths, roi
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32630)
+    geo = (ORIGIN[0], PIXEL_SIZE, 0.0, ORIGIN[1], 0.0, -PIXEL_SIZE)
+
+    driver = gdal.GetDriverByName("GTiff")
+    for seed, path in enumerate(paths):
+        ds = driver.Create(
+            path,
+            size,
+            size,
+            BANDS,
+            gdal.GDT_UInt16,
+            ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "COMPRESS=DEFLATE"],
+        )
+        ds.SetGeoTransform(geo)
+        ds.SetProjection(srs.ExportToWkt())
+        for yoff in range(0, size, BLOCK):
+            for xoff in range(0, size, BLOCK):
+                w, h = min(BLOCK, size - xoff), min(BLOCK, size - yoff)
+                # same scene for both dates, plus noise and a changed area
+                rng = np.random.RandomState(yoff * size + xoff)
+                base = rng.randint(200, 3000, (BANDS, h, w))
+                noise = np.random.RandomState(seed * size * size + yoff * size + xoff)
+                data = base + noise.randint(0, 50, (BANDS, h, w))
+                if seed and xoff < size // 4:
+                    data[3] //= 2
+                for i in range(BANDS):
+                    ds.GetRasterBand(i + 1).WriteArray(data[i], xoff, yoff)
+        ds = None
+
+    # a coastal strip along the diagonal of the scene
+    source = ogr.GetDriverByName("ESRI Shapefile").CreateDataSource(roi)
+    layer = source.CreateLayer("roi", srs, ogr.wkbPolygon)
+    extent = size * PIXEL_SIZE
+    line = ogr.Geometry(ogr.wkbLineString)
+    line.AddPoint(ORIGIN[0] + 0.05 * extent, ORIGIN[1] - 0.05 * extent)
+    line.AddPoint(ORIGIN[0] + 0.95 * extent, ORIGIN[1] - 0.95 * extent)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(line.Buffer(0.05 * extent))
+    layer.CreateFeature(feature)
+    source = None
+
+    return paths, roi
+
+
+class LittoDynBenchObserver(LittoDynObserver):
+    """
+    Sum of elapsed time per stage
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def stage_finished(self, stage, elapsed, bytes_read=0, pixels=0):
+        self.stages[stage] = self.stages.get(stage, 0) + elapsed
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process, in bytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+
+def compare(path, reference):
+    """
+    Differences between an output and its reference raster
+    """
+    out = gdal.Open(path).ReadAsArray()
+    ref = gdal.Open(reference).ReadAsArray()
+    if out.shape != ref.shape:
+        return {"same_shape": False}
+
+    nan = np.isnan(out) != np.isnan(ref)
+    valid = ~(np.isnan(out) | np.isnan(ref))
+    diff = np.abs(out[valid] - ref[valid])
+    return {
+        "same_shape": True,
+        "nan_mismatch": int(nan.sum()),
+        "max_abs_diff": float(diff.max()) if diff.size else 0.0,
+    }
+
+
+def run(case):
+    """
+    Run a case, in a dedicated process
+    """
+    algo, size, mode, paths, roi, workdir, options = case
+    cls = ALGOS[algo].load()
+    path_out = os.path.join(workdir, "{}_{}_{}.tif".format(algo, size, mode))
+    observer = LittoDynBenchObserver()
+
+    start = time.perf_counter()
+    detector = cls(
+        paths[0],
+        paths[1],
+        roi,
+        windowed=mode == "windowed",
+        observer=observer,
+        **options
+    )
+    detector.detect()
+    detector.save(path_out)
+    total = time.perf_counter() - start
+
+    return {
+        "algorithm": algo,
+        "size": size,
+        "mode": mode,
+        "stages": observer.stages,
+        "total": total,
+        "pixels_per_second": size * size / total,
+        "peak_rss": peak_rss(),
+        "output": path_out,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark change detectors")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000])
+    # detectors needing more bands than synthetic rasters are not run
+    algos = [name for name, spec in ALGOS.items() if spec.bands <= BANDS]
+    parser.add_argument("--algos", nargs="+", default=algos, choices=ALGOS)
+    parser.add_argument(
+        "--mode", choices=["memory", "windowed"], nargs="+", default=["memory"]
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--references", default=None)
+    parser.add_argument("--update-references", action="store_true")
+    parser.add_argument("--output", default="-")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.references:
+        os.makedirs(args.references, exist_ok=True)
+
+    options = {"workers": args.workers, "cache": False}
+    if "PCA" in args.algos:
+        options_pca = dict(options, seed=0)
+
+    results = []
+    for size in args.sizes:
+        paths, roi = generate(args.workdir, size)
+        for algo in args.algos:
+            for mode in args.mode:
+                opts = options_pca if algo == "PCA" else options
+                case = (algo, size, mode, paths, roi, args.workdir, opts)
+                # fresh process per case for a meaningful peak rss
+                try:
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        result = executor.submit(run, case).result()
+                except Exception as e:
+                    # a failed case is reported, other cases are run
+                    print("{} {} {}: {}".format(algo, size, mode, e), file=sys.stderr)
+                    results.append(
+                        {"algorithm": algo, "size": size, "mode": mode, "error": str(e)}
+                    )
+                    continue
+
+                if args.references:
+                    reference = os.path.join(
+                        args.references, "{}_{}.tif".format(algo, size)
+                    )
+                    if args.update_references:
+                        gdal.Translate(reference, result["output"])
+                    elif os.path.exists(reference):
+                        result["reference"] = compare(result["output"], reference)
+
+                print(
+                    "{} {} {}: {:.2f}s".format(algo, size, mode, result["total"]),
+                    file=sys.stderr,
+                )
+                results.append(result)
+
+    report = {
+        "version": version(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "gdal": gdal.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def version():
+    cwd = os.path.dirname(os.path.realpath(__file__))
+    with open(os.path.join(cwd, "..", "metadata.txt")) as f:
+        for line in f:
+            if line.startswith("version="):
+                return line.strip().split("=", 1)[1]
+    return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+# Benchmark of import times, which QGIS pays at startup for the plugin
+#
+# Each case is imported in a fresh interpreter, several times, and reports its
+# median import time and the heavy modules it loaded. Listing detectors must
+# not load any of them: detectors are imported on first use only, which is
+# timed by the load:<name> cases. Results are written as JSON:
+#
+#   $ PYTHONPATH=$(pwd) python tests/benchmark_startup.py --repeat 5 \
+#       --output startup.json
+#
+# With --max-ms, the exit code is 1 when the registry import is slower.
+
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+
+HEAVY = ["numpy", "scipy", "osgeo", "sklearn"]
+
+CASE = """
+import sys, json, time
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def cases():
+    """
+    Code of each case, by name: the registry, the batch entry point and the
+    loading of each detector through the registry
+    """
+    from src.core import registry
+
+    code = {
+        "registry": "from src.core import registry; registry.detectors",
+        "batch": "from src.core import batch",
+    }
+    for name in registry.detectors:
+        code["load:{}".format(name)] = (
+            "from src.core import registry; "
+            "registry.detector({!r}).load()".format(name)
+        )
+    return code
+
+
+def run(code, root):
+    """
+    Import time of code in a fresh interpreter
+    """
+    path = [root] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path))
+    out = subprocess.run(
+        [sys.executable, "-c", CASE.format(code=code, heavy=HEAVY)],
+        cwd=root,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if out.returncode:
+        return {"error": out.stderr.strip().splitlines()[-1]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+    root = os.path.abspath(root)
+    sys.path.insert(0, root)
+    available = cases()
+
+    parser = argparse.ArgumentParser(description="Benchmark import times")
+    parser.add_argument("--cases", nargs="+", default=list(available))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None)
+    parser.add_argument("--output", default="-")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.cases:
+        runs = [run(available[name], root) for _ in range(args.repeat)]
+        errors = [r["error"] for r in runs if "error" in r]
+        if errors:
+            result = {"case": name, "error": errors[0]}
+            print("{}: {}".format(name, errors[0]), file=sys.stderr)
+        else:
+            seconds = statistics.median(r["seconds"] for r in runs)
+            result = {"case": name, "seconds": seconds, "heavy": runs[0]["heavy"]}
+            print(
+                "{}: {:.1f}ms {}".format(
+                    name, seconds * 1000, " ".join(result["heavy"])
+                ),
+                file=sys.stderr,
+            )
+        results.append(result)
+
+    report = {
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+        },
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_ms is not None:
+        for result in results:
+            if result["case"] == "registry" and "seconds" in result:
+                if result["seconds"] * 1000 > args.max_ms:
+                    return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
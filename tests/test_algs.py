@@ -10,6 +10,7 @@ __license__ = "GPLv3"
 import os
 from src.core.changedetector.evi import LittoDynChangeDetectorEvi
 from src.core.changedetector.pca import LittoDynChangeDetectorPca
+from src.core.changedetector.multi import LittoDynChangeDetectorMulti
 from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
 from src.core.changedetector.ngrdi import LittoDynChangeDetectorNgrdi
 from src.core.changedetector.norm_cos import LittoDynChangeDetectorNormCos
@@ -47,3 +48,10 @@ for mykey in dict_algos.keys():
 
     res = os.path.join(cwd, "{}.tif".format(mykey))
     myobj.save(res)
+
+# all algorithms in a single pass, one band per algorithm
+myobj = LittoDynChangeDetectorMulti(
+    img1, img2, roi, list(dict_algos.values()), list(dict_algos.keys())
+)
+myobj.detect()
+myobj.save(os.path.join(cwd, "ALL.tif"))
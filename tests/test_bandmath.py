@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import numpy as np
+import pytest
+
+from src.core import bandmath
+
+
+def image():
+    rng = np.random.RandomState(0)
+    return rng.randint(1, 5000, (4, 301, 257)).astype(np.float32)
+
+
+def test_indices():
+    img = image()
+    b, g, r, nir = img
+    expected = {
+        "NDVI": (nir - r) / (nir + r),
+        "EVI": 2.5 * ((nir - r) / (nir + 6 * r - 7.5 * b + 1)),
+        "NGRDI": (g - r) / (g + r),
+        "SAVI": 1.5 * (nir - r) / (nir + r + 0.5),
+        "NDWI": (g - nir) / (g + nir),
+    }
+
+    # same operations as numpy, so identical results
+    for name, values in expected.items():
+        result = bandmath.index(name).evaluate(img)
+        assert result.dtype == np.float32
+        np.testing.assert_array_equal(result, values)
+
+
+def test_scratch():
+    assert bandmath.index("NDVI").scratch == 1
+    assert bandmath.index("EVI").scratch == 1
+
+    img = image()
+    b, g, r, nir = img
+    expression = bandmath.LittoDynExpression("-(NIR*R) + (B-G)*(NIR-R)/(G*B-R)")
+    expected = -(nir * r) + (b - g) * (nir - r) / (g * b - r)
+    np.testing.assert_array_equal(expression.evaluate(img), expected)
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        bandmath.LittoDynExpression("NIR**2")
+    with pytest.raises(ValueError):
+        bandmath.LittoDynExpression("X+1")
+    with pytest.raises(ValueError):
+        bandmath.index("MNDWI").evaluate(image())
+    with pytest.raises(ValueError):
+        bandmath.LittoDynExpression("NIR*(1/(1-1))")
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import io
+
+from src.core import batch
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def manifest(tmpdir):
+    path = os.path.join(str(tmpdir), "jobs.csv")
+    with open(path, "w") as f:
+        f.write("id,image1,image2,roi,algorithms,output\n")
+        f.write("a,{},{},{},NDVI;EUCL,out/a.tif\n".format(img1, img2, roi))
+        f.write("b,{},{},{},COS,out/b.tif\n".format(img1, img2, roi))
+    return path
+
+
+def test_manifest(tmpdir):
+    jobs = batch.read_manifest(manifest(tmpdir))
+
+    assert [job["id"] for job in jobs] == ["a", "b"]
+    assert jobs[0]["algorithms"] == ["NDVI", "EUCL"]
+    assert jobs[1]["output"] == os.path.join(str(tmpdir), "out", "b.tif")
+
+
+def test_resume(tmpdir):
+    path = manifest(tmpdir)
+    path_journal = "{}.status.json".format(path)
+    jobs = batch.read_manifest(path)
+    options = {"detector": {"windowed": True, "workers": 1}, "save": {}}
+    assert batch.process(jobs, {}, path_journal, options, processes=2) == 0
+
+    journal = batch.read_journal(path_journal)
+    assert {s["status"] for s in journal.values()} == {"done"}
+
+    # complete outputs are skipped, others are run again, whatever the
+    # number of workers
+    os.remove(os.path.join(str(tmpdir), "out", "b.tif"))
+    log = io.StringIO()
+    options["detector"]["workers"] = 2
+    assert batch.process(jobs, journal, path_journal, options, log=log) == 0
+    lines = log.getvalue().splitlines()
+    assert lines[0] == "a: skipped, output complete"
+    assert lines[1].startswith("b: done")
+    assert os.path.exists(os.path.join(str(tmpdir), "out", "b.tif"))
+
+    # outputs made with other options are run again
+    log = io.StringIO()
+    options["save"] = {"encoding": "int16"}
+    assert batch.process(jobs, journal, path_journal, options, log=log) == 0
+    assert "skipped" not in log.getvalue()
+    journal = batch.read_journal(path_journal)
+    assert journal["a"]["options"]["save"] == {"encoding": "int16"}
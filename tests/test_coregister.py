@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+from osgeo import gdal
+
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def test_same_grid():
+    detector = LittoDynChangeDetectorNdvi(img1, img2, roi)
+    assert detector.path_img2 == img2
+
+
+def test_coregister(tmpdir):
+    # image 2 on a coarser grid
+    ds = gdal.Open(img2)
+    geo = ds.GetGeoTransform()
+    path = os.path.join(str(tmpdir), "coarse.tif")
+    gdal.Warp(path, img2, xRes=geo[1] * 2, yRes=abs(geo[5]) * 2)
+
+    detector = LittoDynChangeDetectorNdvi(img1, path, roi)
+    assert detector.path_img2.endswith(".vrt")
+    assert detector.img2.shape == detector.img1.shape
+
+    detector.detect()
+    inside = detector.roi_mask != 0
+    assert np.all(np.isfinite(detector.change[inside]))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from src.core.changedetector.multi import LittoDynChangeDetectorMulti
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+from src.core.changedetector.norm_cos import LittoDynChangeDetectorNormCos
+from src.core.changedetector.norm_euclid import LittoDynChangeDetectorNormEuclid
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+DETECTORS = {
+    "EUCL": LittoDynChangeDetectorNormEuclid,
+    "COS": LittoDynChangeDetectorNormCos,
+    "NDVI": LittoDynChangeDetectorNdvi,
+}
+
+
+def run(cls, path, *args, **options):
+    detector = cls(img1, img2, roi, *args, **options)
+    detector.detect()
+    detector.save(path)
+
+    ds = gdal.Open(path)
+    bands = [ds.GetRasterBand(i + 1) for i in range(ds.RasterCount)]
+    return [b.ReadAsArray() for b in bands], [b.GetDescription() for b in bands]
+
+
+@pytest.mark.parametrize("windowed", [False, True])
+def test_multi(tmpdir, windowed):
+    names = list(DETECTORS)
+    path = os.path.join(str(tmpdir), "multi.tif")
+    multi, descriptions = run(
+        LittoDynChangeDetectorMulti,
+        path,
+        list(DETECTORS.values()),
+        names,
+        windowed=windowed,
+    )
+
+    assert descriptions == names
+    for band, (name, cls) in zip(multi, DETECTORS.items()):
+        path = os.path.join(str(tmpdir), "{}.tif".format(name))
+        (single,), _ = run(cls, path, windowed=windowed)
+        # shared intermediates give the same values as a standalone run
+        np.testing.assert_array_equal(band, single)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import warnings
+
+import numpy as np
+from scipy.spatial import distance
+
+from src.core.changedetector.norm_cos import (
+    cosine_distance,
+    LittoDynChangeDetectorNormCos,
+)
+from src.core.changedetector.norm_corr import LittoDynChangeDetectorNormCorr
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def reference(detector, metric):
+    """
+    Per pixel scipy distance, as computed by the former implementation
+    """
+    rows, cols = detector.img1.shape[1], detector.img1.shape[2]
+    dist = np.zeros((rows, cols))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for i in range(rows):
+            for j in range(cols):
+                dist[i, j] = metric(detector.img1[:, i, j], detector.img2[:, i, j])
+    dist[np.where(detector.roi_mask == 0)] = np.nan
+    return dist
+
+
+def test_cos():
+    detector = LittoDynChangeDetectorNormCos(img1, img2, roi, dtype=np.float64)
+    detector.detect()
+    ref = reference(detector, distance.cosine)
+    np.testing.assert_allclose(detector.change, ref, rtol=1e-12, equal_nan=True)
+
+
+def test_corr():
+    detector = LittoDynChangeDetectorNormCorr(img1, img2, roi, dtype=np.float64)
+    detector.detect()
+    ref = reference(detector, distance.correlation)
+    np.testing.assert_allclose(detector.change, ref, rtol=1e-12, equal_nan=True)
+
+
+def test_edge_cases():
+    u = np.array([[[0, 0, 0, 0], [1, 1, 1, 1], [1, 2, 3, 4], [-1, -2, -3, -4]]]).T
+    v = np.array([[[1, 2, 3, 4], [2, 2, 2, 2], [2, 4, 6, 8], [1, 2, 3, 4]]]).T
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for centered, metric in (
+            (False, distance.cosine),
+            (True, distance.correlation),
+        ):
+            ref = [metric(u[:, j, 0], v[:, j, 0]) for j in range(u.shape[1])]
+            dist = cosine_distance(u.astype(float), v.astype(float), centered)
+            np.testing.assert_array_equal(dist[:, 0], ref)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import pytest
+
+from src.core.observer import LittoDynCancelled, LittoDynCancelToken, LittoDynObserver
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+MODES = {
+    "memory": {},
+    "windowed": {"windowed": True, "prefetch": 0},
+    "prefetch": {"windowed": True, "prefetch": 2},
+    "pool": {"windowed": True, "workers": 2},
+}
+
+
+class Recorder(LittoDynObserver):
+    """
+    Finished stages and progress, cancelling after a number of windows
+    """
+
+    def __init__(self, cancel=None, after=None):
+        self.stages = []
+        self.fractions = []
+        self.cancel = cancel
+        self.after = after
+
+    def stage_finished(self, stage, elapsed, bytes_read=0, pixels=0):
+        self.stages.append(stage)
+
+    def progress(self, fraction):
+        self.fractions.append(fraction)
+        if self.cancel is not None and len(self.fractions) == self.after:
+            self.cancel.cancel()
+
+
+def detector(observer, cancel=None, **options):
+    detector = LittoDynChangeDetectorNdvi(
+        img1, img2, roi, observer=observer, cancel=cancel, **options
+    )
+    # a few rows per window, so that scenes are computed in many windows
+    detector.window_pixels = 4 * detector.cols
+    return detector
+
+
+@pytest.mark.parametrize("mode", list(MODES))
+def test_stages(tmpdir, mode):
+    observer = Recorder()
+    path = os.path.join(str(tmpdir), "changes.tif")
+    d = detector(observer, **MODES[mode])
+    d.detect()
+    d.save(path)
+
+    # stages of windows computed by pool workers are not observed
+    expected = {"load", "mask", "detect", "save"}
+    if mode == "pool":
+        expected = {"save"}
+    assert expected <= set(observer.stages)
+    assert observer.fractions[-1] == 1.0
+
+
+@pytest.mark.parametrize("mode", ["windowed", "prefetch", "pool"])
+def test_cancel(tmpdir, mode):
+    cancel = LittoDynCancelToken()
+    observer = Recorder(cancel, after=2)
+    path = os.path.join(str(tmpdir), "changes.tif")
+    d = detector(observer, cancel, **MODES[mode])
+    windows = len(list(d._windows()))
+
+    with pytest.raises(LittoDynCancelled):
+        d.detect()
+        d.save(path)
+
+    # no window is computed once cancelled, and the output is removed
+    assert windows > 2
+    assert len(observer.fractions) == 2
+    assert not os.path.exists(path)
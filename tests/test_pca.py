@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+
+from src.core.changedetector.pca import LittoDynChangeDetectorPca
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def test_seed():
+    changes = []
+    for _ in range(2):
+        detector = LittoDynChangeDetectorPca(img1, img2, roi, seed=0)
+        detector.detect()
+        changes.append(detector.change)
+
+    np.testing.assert_array_equal(changes[0], changes[1])
+
+
+def test_roi():
+    detector = LittoDynChangeDetectorPca(img1, img2, roi, seed=0)
+    detector.detect()
+
+    inside = detector.roi_mask != 0
+    assert np.all(np.isnan(detector.change[~inside]))
+    assert set(np.unique(detector.change[inside])) <= {0, 1, 2}
+
+
+def test_block_size():
+    detector = LittoDynChangeDetectorPca(img1, img2, roi, seed=0, block_size=3)
+    detector.detect()
+
+    inside = detector.roi_mask != 0
+    assert np.all(np.isnan(detector.change[~inside]))
+    assert set(np.unique(detector.change[inside])) <= {0, 1, 2}
+
+
+def loops(img1, img2, roi_mask, seed):
+    """
+    Change map computed pixel by pixel, as before vectorization, on images of
+    shape (rows, cols, bands)
+    """
+    diff_image = np.abs(img1 - img2)
+    isdata = np.where(roi_mask)
+
+    vector_set = np.zeros([len(isdata[0]), diff_image.shape[2]])
+    for i in range(len(isdata[0])):
+        vector_set[i, :] = diff_image[isdata[0][i], isdata[1][i], :]
+    mean_vec = np.mean(vector_set, axis=0)
+    vector_set -= mean_vec
+
+    pca = PCA(random_state=seed)
+    pca.fit(vector_set)
+    EVS = pca.components_
+
+    feature_vector_set = np.zeros([len(isdata[0]), diff_image.shape[2]])
+    for i in range(len(isdata[0])):
+        feature_vector_set[i, :] = diff_image[isdata[0][i], isdata[1][i], :]
+    FVS = np.dot(feature_vector_set, EVS) - mean_vec
+
+    kmeans = KMeans(3, verbose=0, random_state=seed)
+    kmeans.fit(FVS)
+    output = kmeans.predict(FVS)
+
+    change_map = np.zeros(diff_image.shape[:2]) + np.nan
+    for i in range(len(isdata[0])):
+        change_map[isdata[0][i], isdata[1][i]] = output[i]
+    return change_map
+
+
+def small(dtype=np.float64, block_size=1):
+    """
+    Detector on a small array with three groups of changes
+    """
+    rng = np.random.RandomState(0)
+    img1 = rng.uniform(0, 100, (4, 30, 40))
+    img2 = img1 + rng.normal(0, 1, img1.shape)
+    img2[:, :10] += 500
+    img2[:, 20:, 20:] += 2000
+    roi_mask = np.zeros((30, 40), dtype=np.uint8)
+    roi_mask[2:28, 3:37] = 1
+
+    detector = LittoDynChangeDetectorPca.__new__(LittoDynChangeDetectorPca)
+    detector.img1, detector.img2 = img1.astype(dtype), img2.astype(dtype)
+    detector.roi_mask = roi_mask
+    detector.dtype = np.dtype(dtype)
+    detector.shared = {}
+    detector.seed = 0
+    detector.block_size = block_size
+    return detector
+
+
+def test_loops():
+    detector = small()
+    detector._dodetect()
+    img1, img2, roi_mask = detector.img1, detector.img2, detector.roi_mask
+
+    expected = loops(img1.transpose(1, 2, 0), img2.transpose(1, 2, 0), roi_mask, seed=0)
+    np.testing.assert_array_equal(detector.change, expected)
+
+
+@pytest.mark.parametrize("block_size", [1, 3])
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_dtype(dtype, block_size):
+    detector = small(dtype, block_size)
+    detector._dodetect()
+    assert detector.change.dtype == dtype
+    assert set(np.unique(detector.change[detector.roi_mask != 0])) == {0, 1, 2}
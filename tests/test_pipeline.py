@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import threading
+
+import pytest
+
+from src.core.pipeline import LittoDynAsyncWriter, LittoDynPrefetchReader
+from src.core.writer import LittoDynRasterWriter
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+class Writer(object):
+    """
+    Raster writer recording windows, failing on a given offset
+    """
+
+    def __init__(self, fail=None):
+        self.fail = fail
+        self.written = []
+        self.closed = False
+        self.discarded = False
+
+    def write(self, data, xoff, yoff):
+        if yoff == self.fail:
+            raise IOError("write {}".format(yoff))
+        self.written.append(yoff)
+
+    def close(self):
+        self.closed = True
+
+    def discard(self):
+        self.discarded = True
+
+
+def failing_read(item):
+    if item == 3:
+        raise IOError("read {}".format(item))
+    return item * 2
+
+
+def test_reader():
+    reader = LittoDynPrefetchReader(lambda item: item * 2, range(10), depth=2)
+    try:
+        assert list(reader) == [(i, i * 2) for i in range(10)]
+        # exhausted reader keeps on stopping
+        assert list(reader) == []
+    finally:
+        reader.close()
+    assert not reader.thread.is_alive()
+
+
+def test_reader_error():
+    reader = LittoDynPrefetchReader(failing_read, range(10), depth=2)
+    items = []
+    with pytest.raises(IOError, match="read 3"):
+        try:
+            for item, data in reader:
+                items.append(item)
+        finally:
+            reader.close()
+    assert items == [0, 1, 2]
+    assert not reader.thread.is_alive()
+
+
+def test_reader_close():
+    # the consumer stops while the thread is blocked on a full queue
+    reader = LittoDynPrefetchReader(lambda item: item, range(100), depth=1)
+    assert next(reader) == (0, 0)
+    reader.close()
+    assert not reader.thread.is_alive()
+
+
+def test_writer():
+    writer = Writer()
+    async_writer = LittoDynAsyncWriter(writer, depth=1)
+    for yoff in range(10):
+        async_writer.write(None, 0, yoff)
+    async_writer.close()
+
+    assert writer.written == list(range(10))
+    assert writer.closed and not writer.discarded
+    assert not async_writer.thread.is_alive()
+
+
+def test_writer_error():
+    writer = Writer(fail=3)
+    async_writer = LittoDynAsyncWriter(writer, depth=1)
+    # writes after the failure are drained, and the error is raised by a
+    # later write or by close
+    with pytest.raises(IOError, match="write 3"):
+        for yoff in range(100):
+            async_writer.write(None, 0, yoff)
+        async_writer.close()
+
+    assert writer.written == [0, 1, 2]
+    async_writer.discard()
+    assert writer.discarded and not writer.closed
+    assert not async_writer.thread.is_alive()
+
+
+def test_writer_close_error():
+    writer = Writer(fail=9)
+    async_writer = LittoDynAsyncWriter(writer, depth=20)
+    for yoff in range(10):
+        async_writer.write(None, 0, yoff)
+    with pytest.raises(IOError, match="write 9"):
+        async_writer.close()
+
+    assert writer.discarded and not writer.closed
+    assert not async_writer.thread.is_alive()
+
+
+def detector():
+    detector = LittoDynChangeDetectorNdvi(img1, img2, roi, windowed=True, prefetch=2)
+    # a few rows per window, so that scenes are computed in many windows
+    detector.window_pixels = 4 * detector.cols
+    return detector
+
+
+def test_detector_read_error(tmpdir, monkeypatch):
+    d = detector()
+    windows = list(d._windows())
+    prefetch = d._prefetch
+
+    def read(window):
+        if window == windows[3]:
+            raise IOError("read window")
+        return prefetch(window)
+
+    # the prefetch thread reads through a copy of the detector
+    monkeypatch.setattr(type(d), "_prefetch", lambda self, window: read(window))
+
+    threads = set(threading.enumerate())
+    path = os.path.join(str(tmpdir), "changes.tif")
+    d.detect()
+    with pytest.raises(IOError, match="read window"):
+        d.save(path)
+
+    assert set(threading.enumerate()) <= threads
+    assert not os.path.exists(path)
+    assert d.datasets == {}
+
+
+def test_detector_write_error(tmpdir, monkeypatch):
+    d = detector()
+    write = LittoDynRasterWriter.write
+    written = []
+
+    def failing_write(self, data, xoff, yoff):
+        if len(written) == 3:
+            raise IOError("write window")
+        write(self, data, xoff, yoff)
+        written.append((xoff, yoff))
+
+    monkeypatch.setattr(LittoDynRasterWriter, "write", failing_write)
+
+    threads = set(threading.enumerate())
+    path = os.path.join(str(tmpdir), "changes.tif")
+    d.detect()
+    with pytest.raises(IOError, match="write window"):
+        d.save(path)
+
+    assert set(threading.enumerate()) <= threads
+    assert not os.path.exists(path)
+    assert d.datasets == {}
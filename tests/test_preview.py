@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def crop(tmpdir, path, cols, rows):
+    out = os.path.join(str(tmpdir), os.path.basename(path))
+    gdal.Translate(out, path, srcWin=[0, 0, cols, rows])
+    return out
+
+
+@pytest.mark.parametrize("odd", [False, True])
+@pytest.mark.parametrize("windowed", [False, True])
+def test_preview(tmpdir, odd, windowed):
+    path1, path2 = img1, img2
+    if odd:
+        # sizes which are not multiples of the scale
+        ds = gdal.Open(img1)
+        cols, rows = ds.RasterXSize // 2 * 2 - 1, ds.RasterYSize // 2 * 2 - 1
+        path1, path2 = crop(tmpdir, img1, cols, rows), crop(tmpdir, img2, cols, rows)
+
+    src = gdal.Open(path1)
+    detector = LittoDynChangeDetectorNdvi(path1, path2, roi, scale=2, windowed=windowed)
+    detector.detect()
+    path = os.path.join(str(tmpdir), "preview.tif")
+    detector.save(path)
+
+    ds = gdal.Open(path)
+    assert ds.RasterXSize == -(-src.RasterXSize // 2)
+    assert ds.RasterYSize == -(-src.RasterYSize // 2)
+
+    geo, src_geo = ds.GetGeoTransform(), src.GetGeoTransform()
+    assert geo[1] == 2 * src_geo[1] and geo[5] == 2 * src_geo[5]
+    assert (geo[0], geo[3]) == (src_geo[0], src_geo[3])
+    assert np.isfinite(ds.ReadAsArray()).any()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import sys
+import subprocess
+
+import pytest
+
+from src.core import registry
+from src.core.bandmath import index
+
+
+def test_lazy():
+    # listing detectors imports none of their dependencies
+    root = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+    code = (
+        "import sys; from src.core import registry; "
+        "[s.missing() for s in registry.detectors.values()]; "
+        "print(' '.join(m for m in ('numpy', 'osgeo', 'sklearn') "
+        "if m in sys.modules))"
+    )
+    out = subprocess.check_output([sys.executable, "-c", code], cwd=root)
+    assert out.strip() == b""
+
+
+def test_order():
+    # enum values of processing models depend on the order of detectors
+    labels = [spec.label for spec in registry.detectors.values()]
+    assert labels == [
+        "PCA",
+        "EVI",
+        "NDVI",
+        "NGRDI",
+        "Euclidean Norm",
+        "Correlation Norm",
+        "Cosine Norm",
+        "SAVI",
+        "NDWI",
+        "MNDWI",
+    ]
+    names = [spec.name for spec in registry.indices()]
+    assert names == ["EVI", "NDVI", "NGRDI", "SAVI", "NDWI", "MNDWI"]
+
+
+def test_bands():
+    for spec in registry.indices():
+        assert spec.bands == max(index(spec.index).used) + 1
+
+
+def test_detector():
+    assert registry.detector("ndvi") is registry.detectors["NDVI"]
+    with pytest.raises(ValueError):
+        registry.detector("unknown")
+
+
+def test_index_detector():
+    from src.core.changedetector.vi import index_detector
+
+    # registered detectors of an index are reused
+    for spec in registry.indices():
+        assert index_detector(spec.index.lower()) is spec.load()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import time
+
+from src.core.results import LittoDynIndexStore, LittoDynResultCache
+
+
+def output(tmpdir, name, size=1000):
+    path = os.path.join(str(tmpdir), name)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def test_key(tmpdir):
+    cache = LittoDynResultCache(os.path.join(str(tmpdir), "cache"))
+    img1 = output(tmpdir, "img1.tif")
+    img2 = output(tmpdir, "img2.tif")
+    roi = [b"geometry"]
+
+    key = cache.key([img1, img2], roi, ["ndvi"], {"scale": 1})
+    assert key == cache.key([img1, img2], roi, ["ndvi"], {"scale": 1})
+    assert key != cache.key([img2, img1], roi, ["ndvi"], {"scale": 1})
+    assert key != cache.key([img1, img2], [b"other"], ["ndvi"], {"scale": 1})
+    assert key != cache.key([img1, img2], roi, ["evi"], {"scale": 1})
+    assert key != cache.key([img1, img2], roi, ["ndvi"], {"scale": 2})
+
+    # a modified input is a new key
+    stat = os.stat(img1)
+    os.utime(img1, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert key != cache.key([img1, img2], roi, ["ndvi"], {"scale": 1})
+
+    # remote inputs are not cached
+    assert cache.key(["/vsicurl/http://host/img.tif", img2], roi, [], {}) is None
+
+
+def test_put_get(tmpdir):
+    cache = LittoDynResultCache(os.path.join(str(tmpdir), "cache"))
+    changes = output(tmpdir, "changes.tif")
+    mask = output(tmpdir, "mask.tif")
+
+    assert cache.get("key") is None
+    cache.put("key", {"changes": changes, "mask": mask}, {"thresholds": [0.5]})
+    files, meta = cache.get("key")
+    assert meta == {"thresholds": [0.5]}
+    with open(files["changes"], "rb") as a, open(changes, "rb") as b:
+        assert a.read() == b.read()
+
+    # restored files survive eviction
+    dest = cache.restore(files["mask"], os.path.join(str(tmpdir), "restored.tif"))
+    cache.clear()
+    assert cache.get("key") is None
+    with open(dest, "rb") as a, open(mask, "rb") as b:
+        assert a.read() == b.read()
+
+
+def test_eviction(tmpdir):
+    cache = LittoDynResultCache(os.path.join(str(tmpdir), "cache"), 3500)
+    changes = output(tmpdir, "changes.tif")
+
+    for key in ("a", "b", "c"):
+        cache.put(key, {"changes": changes})
+        # access times are compared
+        time.sleep(0.01)
+
+    # a is used again, b is the least recently used
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.put("d", {"changes": changes})
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+
+    # disabled cache
+    cache.max_bytes = 0
+    cache.put("e", {"changes": changes})
+    assert cache.get("e") is None
+
+    # entries stored before the cache was disabled are not read
+    assert cache.get("a") is None
+
+
+def test_index_store(tmpdir):
+    store = LittoDynIndexStore(os.path.join(str(tmpdir), "indexes"), 2500)
+
+    # files of an entry are added one by one, without eviction
+    for key in ("a", "b"):
+        for name in ("0.npy", "1.npy"):
+            store.add(key, name, output(tmpdir, name))
+            assert store.file(key, name) is not None
+        time.sleep(0.01)
+    assert store.file("a", "2.npy") is None
+    assert len(store.entries()) == 2
+
+    store.evict()
+    assert store.file("a", "0.npy") is None
+    assert store.file("b", "0.npy") is not None
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+from osgeo import ogr, osr
+
+from src.core.cache import raster_cache
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def wgs84_roi():
+    """
+    Roi geometries reprojected in EPSG:4326, as WKB
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    if hasattr(osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    dataSource = ogr.Open(roi, 0)
+    layer = dataSource.GetLayer()
+    transform = osr.CoordinateTransformation(layer.GetSpatialRef(), srs)
+    geometries = []
+    for feature in layer:
+        geom = feature.GetGeometryRef().Clone()
+        geom.Transform(transform)
+        geometries.append(bytes(geom.ExportToWkb()))
+    return geometries, srs.ExportToWkt()
+
+
+def test_roi_srs():
+    geometries, wkt = wgs84_roi()
+    reference = LittoDynChangeDetectorNdvi(img1, img2, roi, roi_only=True)
+    detector = LittoDynChangeDetectorNdvi(
+        img1, img2, geometries, roi_only=True, roi_srs=wkt
+    )
+
+    # same windows, up to a pixel of reprojection error
+    assert len(detector.roi_windows) == len(reference.roi_windows)
+    for window, expected in zip(detector.roi_windows, reference.roi_windows):
+        assert np.abs(np.subtract(window, expected)).max() <= 1
+
+    inside = np.count_nonzero(detector.roi_mask)
+    expected = np.count_nonzero(reference.roi_mask)
+    assert inside > 0
+    assert abs(inside - expected) <= 0.01 * expected
+
+    reference.detect()
+    detector.detect()
+    assert np.isfinite(detector.change).sum() > 0
+
+
+def squares(detector, boxes):
+    """
+    WKB squares from (col, row, size) pixel boxes of image 1
+    """
+    geo = detector.geo
+    geometries = []
+    for col, row, size in boxes:
+        x0, y0 = geo[0] + col * geo[1], geo[3] + row * geo[5]
+        x1, y1 = x0 + size * geo[1], y0 + size * geo[5]
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in ((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)):
+            ring.AddPoint_2D(x, y)
+        polygon = ogr.Geometry(ogr.wkbPolygon)
+        polygon.AddGeometry(ring)
+        geometries.append(bytes(polygon.ExportToWkb()))
+    return geometries
+
+
+def test_overlapping_statistics():
+    reference = LittoDynChangeDetectorNdvi(img1, img2, roi)
+    boxes = [(20, 20, 60), (50, 50, 60), (150, 20, 40)]
+    geometries = squares(reference, boxes)
+
+    detector = LittoDynChangeDetectorNdvi(
+        img1, img2, geometries, roi_srs=reference.proj, statistics=True
+    )
+    detector.detect()
+    fields, results = detector.statistics()
+
+    # pixels shared by the first two features count for both
+    for geometry, values in zip(geometries, results):
+        alone = LittoDynChangeDetectorNdvi(
+            img1, img2, [geometry], roi_srs=reference.proj, statistics=True
+        )
+        alone.detect()
+        _, expected = alone.statistics()
+        assert values[0] > 0
+        assert values == expected[0]
+
+
+def test_cache_other_roi():
+    raster_cache.clear()
+    reference = LittoDynChangeDetectorNdvi(img1, img2, roi, roi_only=True, cache=True)
+    geometries = squares(reference, [(20, 20, 60), (150, 20, 40)])
+
+    # blocks read for the first roi are reused by the second one
+    hits = raster_cache.hits
+    detector = LittoDynChangeDetectorNdvi(
+        img1, img2, geometries, roi_srs=reference.proj, roi_only=True, cache=True
+    )
+    assert raster_cache.hits > hits
+
+    expected = LittoDynChangeDetectorNdvi(
+        img1, img2, geometries, roi_srs=reference.proj, roi_only=True
+    )
+    np.testing.assert_array_equal(detector.img1, expected.img1)
+    np.testing.assert_array_equal(detector.img2, expected.img2)
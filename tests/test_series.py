@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from src.core.results import LittoDynIndexStore
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+from src.core.changedetector.series import LittoDynChangeDetectorSeries
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+
+def series(path, **options):
+    detector = LittoDynChangeDetectorSeries(
+        [img1, img2, img1], roi, windowed=True, roi_only=True, **options
+    )
+    detector.detect()
+    detector.save(path)
+    return gdal.Open(path).ReadAsArray()
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_index_store(tmpdir, monkeypatch, workers):
+    store = LittoDynIndexStore(os.path.join(str(tmpdir), "indexes"))
+    path = os.path.join(str(tmpdir), "changes.tif")
+    expected = series(path, index_store=store, workers=workers)
+    # one entry per date, image 1 being the first and last date
+    entries = len(store.entries())
+    assert entries == 2
+
+    # indexes stored by workers or a previous session are read from the store
+    def vi(self, img):
+        raise AssertionError("index computed again")
+
+    monkeypatch.setattr(LittoDynChangeDetectorNdvi, "_vi", vi)
+    change = series(path, index_store=store)
+    assert len(store.entries()) == entries
+    assert np.array_equal(change, expected, equal_nan=True)
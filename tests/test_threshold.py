@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import numpy as np
+
+from src.core.threshold import LittoDynHistogram
+
+
+def values():
+    # unchanged pixels around 0.05, changed ones around 0.6
+    rng = np.random.RandomState(0)
+    low = rng.normal(0.05, 0.02, 90000)
+    high = rng.normal(0.6, 0.1, 10000)
+    values = np.concatenate((low, high)).astype(np.float32)
+    rng.shuffle(values)
+    values[::97] = np.nan
+    return values
+
+
+def test_percentile():
+    data = values()
+    histogram = LittoDynHistogram()
+    # range grows as chunks come
+    for chunk in np.array_split(np.sort(data)[::-1], 10):
+        histogram.update(chunk)
+
+    valid = data[np.isfinite(data)]
+    assert histogram.count == valid.size
+    for q in (10, 50, 90, 99):
+        assert abs(histogram.percentile(q) - np.percentile(valid, q)) < 1e-3
+
+
+def test_otsu():
+    histogram = LittoDynHistogram()
+    for chunk in np.array_split(values(), 7):
+        histogram.update(chunk)
+
+    threshold = histogram.threshold("otsu")
+    assert 0.15 < threshold < 0.45
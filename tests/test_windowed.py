@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+import sys
+import multiprocessing.spawn
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from src.core import registry
+from src.core.changedetector import base
+from src.core.changedetector.ndvi import LittoDynChangeDetectorNdvi
+from src.core.changedetector.norm_cos import LittoDynChangeDetectorNormCos
+from src.core.changedetector.norm_euclid import LittoDynChangeDetectorNormEuclid
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+DETECTORS = [
+    LittoDynChangeDetectorNormEuclid,
+    LittoDynChangeDetectorNdvi,
+    LittoDynChangeDetectorNormCos,
+]
+
+# detectors which may run on roi pixels only, on 4 bands images
+TILEABLE = [
+    spec.load()
+    for spec in registry.detectors.values()
+    if spec.bands <= 4 and spec.load().tileable
+]
+
+
+def run(tmpdir, cls, name, **options):
+    path = os.path.join(str(tmpdir), "{}.tif".format(name))
+    detector = cls(img1, img2, roi, cache=False, **options)
+    # a few rows per window, so that scenes are computed in many windows
+    detector.window_pixels = 4 * detector.cols
+    detector.detect()
+    detector.save(path)
+    return gdal.Open(path).ReadAsArray()
+
+
+@pytest.mark.parametrize("cls", DETECTORS)
+@pytest.mark.parametrize("roi_only", [False, True])
+def test_windowed(tmpdir, cls, roi_only):
+    memory = run(tmpdir, cls, "memory", roi_only=roi_only)
+    windowed = run(tmpdir, cls, "windowed", roi_only=roi_only, windowed=True)
+    assert np.isfinite(memory).any()
+    assert np.array_equal(memory, windowed, equal_nan=True)
+
+
+@pytest.mark.parametrize("cls", DETECTORS)
+def test_workers(tmpdir, cls):
+    single = run(tmpdir, cls, "single", windowed=True, workers=1)
+    pool = run(tmpdir, cls, "pool", windowed=True, workers=2)
+    assert np.array_equal(single, pool, equal_nan=True)
+
+
+def test_pool_context(tmpdir, monkeypatch):
+    # python embedded in an application, with its interpreter
+    prefix = str(tmpdir)
+    executable = multiprocessing.spawn.get_executable()
+    monkeypatch.setattr(multiprocessing.spawn, "_python_exe", executable)
+    monkeypatch.setattr(sys, "executable", os.path.join(prefix, "qgis-bin"))
+    monkeypatch.setattr(sys, "exec_prefix", prefix)
+    assert base._pool_context() is None
+
+    python = os.path.join(prefix, "bin", "python3")
+    os.makedirs(os.path.dirname(python))
+    open(python, "w").close()
+    context = base._pool_context()
+    assert context.get_start_method() == "spawn"
+
+
+@pytest.mark.parametrize("cls", TILEABLE)
+@pytest.mark.parametrize("windowed", [False, True])
+def test_sparse(tmpdir, cls, windowed):
+    dense = run(tmpdir, cls, "dense", windowed=windowed)
+    sparse = run(tmpdir, cls, "sparse", windowed=windowed, sparse=True)
+
+    # the roi covers part of the scene only
+    assert np.isfinite(dense).any() and np.isnan(dense).any()
+    assert np.array_equal(np.isnan(sparse), np.isnan(dense))
+    assert np.array_equal(sparse, dense, equal_nan=True)
+
+
+@pytest.mark.parametrize("prefetch", [0, 2])
+def test_datasets(tmpdir, monkeypatch, prefetch):
+    opened = []
+    gdal_open = gdal.Open
+
+    def open_(path, *args):
+        opened.append(path)
+        return gdal_open(path, *args)
+
+    monkeypatch.setattr(gdal, "Open", open_)
+    path = os.path.join(str(tmpdir), "changes.tif")
+    detector = LittoDynChangeDetectorNdvi(
+        img1, img2, roi, windowed=True, prefetch=prefetch
+    )
+    detector.window_pixels = 4 * detector.cols
+    detector.detect()
+    detector.save(path)
+
+    # images are opened once for metadata, and once for all windows
+    assert len(list(detector._windows())) > 2
+    assert opened.count(img1) == 2
+    assert detector.datasets == {}
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import os
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from src.core.writer import LittoDynRasterWriter
+from src.core.changedetector.base import LittoDynChangeDetector
+from src.core.changedetector.norm_euclid import LittoDynChangeDetectorNormEuclid
+
+cwd = os.path.dirname(os.path.realpath(__file__))
+img1 = os.path.join(cwd, "20170706_102911_0f43_AnalyticMS_SR.tif")
+img2 = os.path.join(cwd, "20180723_104602_103c_AnalyticMS_SR.tif")
+roi = os.path.join(cwd, "roi.shp")
+
+GEO = (300000.0, 3.0, 0.0, 5200000.0, 0.0, -3.0)
+
+
+def decode(path):
+    ds = gdal.Open(path)
+    values = []
+    for i in range(ds.RasterCount):
+        band = ds.GetRasterBand(i + 1)
+        data = band.ReadAsArray().astype(np.float64)
+        invalid = data == band.GetNoDataValue()
+        data = data * (band.GetScale() or 1.0) + (band.GetOffset() or 0.0)
+        data[invalid] = np.nan
+        values.append(data)
+    return np.array(values)
+
+
+def test_int16_round_trip(tmpdir):
+    # values far above 2, and a band in [0, 2]
+    rng = np.random.RandomState(0)
+    data = rng.uniform(0, 5000, (2, 100, 120))
+    data[1] /= 2500
+    data[:, 0, 0] = np.nan
+
+    ranges = [(np.nanmin(d), np.nanmax(d)) for d in data]
+    scale = LittoDynChangeDetector._int16_scale(ranges)
+    path = os.path.join(str(tmpdir), "int16.tif")
+    writer = LittoDynRasterWriter(
+        path, 120, 100, GEO, "", names=["a", "b"], encoding="int16", **scale
+    )
+    writer.write(data, 0, 0)
+    writer.close()
+
+    values = decode(path)
+    assert np.array_equal(np.isnan(values), np.isnan(data))
+    for i in range(2):
+        error = np.nanmax(np.abs(values[i] - data[i]))
+        assert error <= scale["scale"][i] / 2 + 1e-9
+
+
+def test_int16_out_of_range(tmpdir):
+    path = os.path.join(str(tmpdir), "int16.tif")
+    writer = LittoDynRasterWriter(
+        path, 10, 10, GEO, "", encoding="int16", scale=1.0 / 16384
+    )
+    with pytest.raises(ValueError):
+        writer.write(np.full((10, 10), 3.0), 0, 0)
+    writer.discard()
+
+    with pytest.raises(ValueError):
+        LittoDynRasterWriter(path, 10, 10, GEO, "", encoding="int16")
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_float16(tmpdir, dtype):
+    data = np.linspace(0, 100, 100 * 120, dtype=dtype).reshape(100, 120)
+    data[0, 0] = np.nan
+    path = os.path.join(str(tmpdir), "float16.tif")
+    writer = LittoDynRasterWriter(
+        path, 120, 100, GEO, "", dtype=dtype, encoding="float16"
+    )
+    writer.write(data, 0, 0)
+    writer.close()
+
+    band = gdal.Open(path).GetRasterBand(1)
+    assert band.DataType == gdal.GDT_Float32
+    assert band.GetMetadataItem("NBITS", "IMAGE_STRUCTURE") == "16"
+    values = band.ReadAsArray()
+    # half precision
+    np.testing.assert_allclose(values, data, rtol=1e-3)
+
+
+@pytest.mark.parametrize("windowed", [False, True])
+def test_int16_detector(tmpdir, windowed):
+    # norms of reflectances are far above 2
+    reference = os.path.join(str(tmpdir), "float.tif")
+    detector = LittoDynChangeDetectorNormEuclid(img1, img2, roi, windowed=windowed)
+    detector.detect()
+    detector.save(reference)
+
+    path = os.path.join(str(tmpdir), "int16.tif")
+    detector = LittoDynChangeDetectorNormEuclid(img1, img2, roi, windowed=windowed)
+    detector.detect()
+    detector.save(path, encoding="int16")
+
+    expected = decode(reference)
+    values = decode(path)
+    assert np.nanmax(expected) > 2
+    assert np.array_equal(np.isnan(values), np.isnan(expected))
+    scale = gdal.Open(path).GetRasterBand(1).GetScale()
+    assert np.nanmax(np.abs(values - expected)) <= scale / 2 + 1e-3
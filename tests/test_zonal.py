@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+__author__ = "Paul Blottiere"
+__contact__ = "blottiere.paul@gmail.com"
+__copyright__ = "Copyright 2020, Paul Blottiere"
+__date__ = "2020/10/10"
+__email__ = "blottiere.paul@gmail.com"
+__license__ = "GPLv3"
+
+import numpy as np
+
+from src.core.zonal import LittoDynZonalStats
+
+
+def test_windows():
+    rng = np.random.RandomState(0)
+    change = rng.gamma(2, 0.1, (2, 300, 200)).astype(np.float32)
+    change[:, :5] = np.nan
+    labels = rng.randint(0, 4, (300, 200)).astype(np.uint32)
+
+    # accumulated window by window
+    stats = LittoDynZonalStats(3, 2, threshold=0.3, pixel_area=9.0)
+    for y in range(0, 300, 64):
+        stats.update(change[:, y : y + 64], labels[y : y + 64])
+
+    fields = stats.field_names(["a", "b"])
+    assert fields[:2] == ["a_count", "a_mean"]
+    assert len(fields) == 18
+
+    results = stats.results()
+    for label in (1, 2, 3):
+        values = change[1][(labels == label) & np.isfinite(change[1])]
+        values = values.astype(np.float64)
+        result = dict(zip(fields, results[label - 1]))
+
+        assert result["b_count"] == len(values)
+        assert np.isclose(result["b_mean"], values.mean())
+        assert np.isclose(result["b_std"], values.std())
+        assert result["b_max"] == values.max()
+        assert result["b_changed_area"] == 9.0 * (values > 0.3).sum()
+        for q in (10, 50, 90):
+            expected = np.percentile(values, q)
+            assert abs(result["b_p{}".format(q)] - expected) < 0.03 * expected
+
+
+def test_empty_feature():
+    stats = LittoDynZonalStats(2)
+    stats.update(np.ones((4, 4), dtype=np.float32), np.ones((4, 4), dtype=np.uint32))
+
+    results = stats.results()
+    assert results[0][:2] == [16, 1.0]
+    assert results[1] == [0] + [None] * (len(stats.field_names()) - 1)